@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Passes commands to the daemon through its command socket
+
+Usage: command.py SOCKET COMMAND [COMMAND...]
+"""
+import socket
+import sys
+
+
+def main(path, *commands):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(5)
+    client.connect(path)
+    client.sendall(''.join(command + '\n' for command in commands).encode('utf-8'))
+    client.shutdown(socket.SHUT_WR)
+    replies = b''
+    while True:
+        data = client.recv(4096)
+        if not data:
+            break
+        replies += data
+    client.close()
+    return 0 if replies.count(b'\n') == len(commands) else 1
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: %s SOCKET COMMAND [COMMAND...]' % sys.argv[0], file=sys.stderr)
+        sys.exit(2)
+    sys.exit(main(*sys.argv[1:]))
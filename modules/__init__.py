@@ -1,6 +1,34 @@
-from .application import Application
-from .core import GroupedControl, ActionWrapperControl
-from .caffeine import CaffeineControl
-from .redshift import RedshiftControl
-from .volume import VolumeControl
-from .screenlayout import ScreenLayoutAction
+import importlib
+import time
+
+# Start of the startup profile, see --profile-startup
+_import_started = time.perf_counter()
+
+__all__ = ['Application', 'Bar', 'GroupedControl', 'ActionWrapperControl', 'CaffeineControl', 'RedshiftControl',
+           'VolumeControl', 'ScreenLayoutAction']
+
+# Submodules are imported the first time one of their classes is used, so backends of unused modules are never loaded
+_exports = {
+    'Application': '.application',
+    'Bar': '.application',
+    'GroupedControl': '.core',
+    'ActionWrapperControl': '.core',
+    'CaffeineControl': '.caffeine',
+    'RedshiftControl': '.redshift',
+    'VolumeControl': '.volume',
+    'ScreenLayoutAction': '.screenlayout',
+}
+
+
+def __getattr__(name):
+    try:
+        module = _exports[name]
+    except KeyError:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
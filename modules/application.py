@@ -1,34 +1,28 @@
 import argparse
-import pickle
 import signal
 import logging
-
+import sys
 import time
+
 import traceback
 
-from .core import GroupedControl
-from .util import QuitControl, ChildReaperControl
+from . import _import_started
+from .core import AbstractControl, GroupedControl
+from .eventloop import EventLoop
+from .output import FrameWriter
+from .transport import CommandSocketServer
+from .routing import CommandRouter
+from .runtime import Runtime
+from .scheduler import Scheduler
+from .state import StateJournal
+from .supervisor import ProcessSupervisor
+from .util import QuitControl, module_available
 import os
 import stat
 
 logger = logging.getLogger(__name__)
 
-__all__ = ['Application']
-
-class CreateFileType(argparse.FileType):
-    def __init__(self, mode='r', bufsize=-1, encoding=None, errors=None):
-        super().__init__(mode, bufsize, encoding, errors)
-        self.__mode = mode
-        self.__bufsize = bufsize
-        self.__encoding = encoding
-        self.__errors = errors
-
-    def __call__(self, string):
-        try:
-            return super().__call__(string)
-        except argparse.ArgumentTypeError as e:
-            return open(string, 'wb' if 'b' in self.__mode else 'w', self.__bufsize, self.__encoding, self.__errors)
-
+__all__ = ['Application', 'Bar']
 
 class PipeFileType(argparse.FileType):
     def __init__(self, *args, lazy=False, **kwargs):
@@ -39,9 +33,11 @@ class PipeFileType(argparse.FileType):
         try:
             mode = os.stat(string).st_mode
             if not stat.S_ISFIFO(mode):
-                raise argparse.ArgumentTypeError('%s is not a fifo' % strign)
+                raise argparse.ArgumentTypeError('%s is not a fifo' % string)
         except FileNotFoundError:
-            pass
+            if self.lazy and string != '-':
+                # The bars open the fifos by name, so they are created before the daemon opens them
+                os.mkfifo(string)
         if not self.lazy or string == '-':
             return super().__call__(string)
         else:
@@ -91,65 +87,439 @@ class LazyFile:
         return self.__open().writelines(*a)
 
 
+class StartupProfile:
+    """
+    Measures the time spent in the phases of the startup of the daemon
+    """
+
+    def __init__(self, started: float):
+        """
+        :param started: time.perf_counter() at the start of the first phase
+        """
+        self.__started = started
+        self.__last = started
+        self.__phases = []
+
+    def end_phase(self, name: str):
+        """
+        Ends the current phase, the next phase starts immediately
+
+        :param name: Name of the phase that ended
+        """
+        now = time.perf_counter()
+        self.__phases.append((name, now - self.__last))
+        self.__last = now
+
+    def report(self) -> str:
+        """
+        :return: str The duration of every phase that ended, and of the whole startup
+        """
+        lines = ['%-16s %8.1f ms' % (name, duration * 1000) for name, duration in self.__phases]
+        lines.append('%-16s %8.1f ms' % ('total', (self.__last - self.__started) * 1000))
+        return '\n'.join(lines)
+
+
+class Bar(GroupedControl):
+    """
+    The layout of one output pipe, when the application drives several bars
+
+    A bar only arranges the output of its modules, the modules themselves belong to the application.
+    Modules that are shown on several bars are still configured, polled and rendered only once.
+    """
+
+    def __init__(self, *modules, separator=' | '):
+        """
+        :param modules: Modules to show on this bar, in the order they should be displayed
+        :param separator: Separator string used inbetween two modules
+        """
+        super().__init__(*modules, separator=separator)
+        self.modules = modules
+
+    # The lifecycle of the modules is handled by the application, not by the bars that show them
+
+    def configure(self, argument_parser):
+        pass
+
+    def bind_arguments(self, args):
+        AbstractControl.bind_arguments(self, args)
+
+    def bind_runtime(self, runtime):
+        AbstractControl.bind_runtime(self, runtime)
+
+    def register_commands(self, router):
+        pass
+
+    def set_name(self, name: str):
+        AbstractControl.set_name(self, name)
+
+    def load_state_ex(self, state):
+        pass
+
+    def dump_state_ex(self):
+        return {}
+
+    def cleanup(self):
+        pass
+
+    async def cleanup_async(self):
+        pass
+
+    def periodic(self):
+        return False
+
+    async def periodic_async(self):
+        return False
+
+    def respond_to(self, command):
+        return False
+
+    async def respond_to_async(self, command):
+        return False
+
+
 class Application(GroupedControl):
-    def __init__(self, *modules, **kwargs):
-        super().__init__(ChildReaperControl(), *modules, **kwargs)
+    def __init__(self, *modules, bars=(), **kwargs):
+        """
+        :param modules: Modules to show on the bar, in the order they should be displayed
+        :param bars: Layouts of the bars, one for every output pipe. Modules that are included in
+            the bars do not have to be passed in modules, modules can be included in more than one bar.
+            When no bars are given, every output pipe shows the modules.
+        """
+        self.__router = None
+        self.__bars = list(bars)
+        shared = list(modules)
+        for bar in self.__bars:
+            shared += [m for m in bar.modules if not any(m is s for s in shared)]
+        super().__init__(*shared, **kwargs)
 
     def configure(self, argument_parser):
-        argument_parser.add_argument('output_pipe', type=PipeFileType('w', bufsize=1, lazy=True))
+        argument_parser.add_argument('output_pipes', metavar='output_pipe', nargs='+', help='One output pipe for every bar',
+                                     type=PipeFileType('w', bufsize=1, lazy=True))
         argument_parser.add_argument('command_pipe', type=PipeFileType('r', bufsize=1, lazy=True))
-        argument_parser.add_argument('--state-file', type=CreateFileType('r+b'))
+        argument_parser.add_argument('--command-socket', help='Also accept commands on a unix socket at this path, actions use it instead of the command pipe', type=str)
+        argument_parser.add_argument('--profile-startup', help='Report the time spent in every phase of the startup', action='store_true')
+        argument_parser.add_argument('--state-file', help='Keep the state of the modules in this file, and in a journal next to it', type=str)
         super().configure(argument_parser)
 
-    def bind_arguments(self, args):
-        super().bind_arguments(args)
-        if args.state_file is not None and args.state_file.readable():
+    def __load_state(self):
+        # Loaded once the runtime is bound, modules may need it to restore their state
+        if self.args.state_file is not None:
+            self.__state_journal = StateJournal(self.args.state_file)
             try:
-                state = pickle.load(args.state_file)
+                state = self.__state_journal.load()
                 logger.info("Loaded state: %r" % state)
                 self.load_state_ex(state)
             except:
                 logger.exception('Could not load state')
 
-    def cleanup(self):
-        if self.args.state_file is not None:
-            self.args.state_file.seek(0)
-            self.args.state_file.truncate()
+    def __record_state(self):
+        # State only changes together with the shown information, so it is recorded whenever a frame is written
+        if self.__state_journal is not None:
+            self.__state_journal.record(self.dump_state_ex())
+
+    def __save_state(self):
+        if self.__state_journal is not None:
             state = self.dump_state_ex()
             logger.info("Dumped state: %r" % state)
-            pickle.dump(state, self.args.state_file)
-            self.args.state_file.close()
+            self.__state_journal.close(state)
+            self.__state_journal = None
 
+    def __close_output(self):
+        logger.info('Suppressed %d duplicate frames', self.__suppressed_frames)
+        for output in self.__outputs:
+            output.close()
+        self.__outputs = []
+
+    def cleanup(self):
+        self.__stop_command_sources()
+        self.__close_output()
+        self.__save_state()
         super().cleanup()
+        self.__close_runtime()
+
+    async def cleanup_async(self):
+        self.__stop_command_sources()
+        self.__close_output()
+        self.__save_state()
+        await super().cleanup_async()
+        self.__close_runtime()
+
+    def __close_runtime(self):
+        if self.runtime is not None:
+            self.runtime.close()
+
+    def __create_runtime(self, scheduler):
+        pulse = self.__create_pulse_service if module_available('pulsectl') else None
+        return Runtime(self.__loop, scheduler, ProcessSupervisor(self.__loop), pulse)
+
+    def __create_pulse_service(self):
+        # pulsectl is only imported when a module uses pulseaudio
+        from .pulse import PulseService
+        return PulseService(self.__loop)
 
     def respond_to_ex(self, command):
         if command == '':
             return False
         logger.info('Received command %s', command)
+        if self.__router is not None:
+            return self.__router.dispatch(command)
         return super().respond_to_ex(command)
 
+    async def respond_to_ex_async(self, command):
+        if command == '':
+            return False
+        logger.info('Received command %s', command)
+        if self.__router is not None:
+            return await self.__router.dispatch_async(command)
+        return await super().respond_to_ex_async(command)
+
+    def __received_commands(self, commands):
+        """
+        :return: Indices of the non-empty commands in a batch
+        """
+        indices = [i for i, command in enumerate(commands) if command != '']
+        for i in indices:
+            logger.info('Received command %s', commands[i])
+        return indices
+
+    def respond_to_batch(self, commands: list) -> list:
+        """
+        Responds to a batch of non-cleaned user commands
+
+        Runs of consecutive commands for the same module are coalesced to their net effect.
+
+        :param commands: The commands in the order they were received
+        :return: list of bools, whether the displayed information is changed by each command
+        """
+        indices = self.__received_commands(commands)
+        results = [False] * len(commands)
+        for i, result in zip(indices, self.__router.dispatch_all([commands[i] for i in indices])):
+            results[i] = result
+        return results
+
+    async def respond_to_batch_async(self, commands: list) -> list:
+        """
+        Coroutine version of respond_to_batch()
+
+        :param commands: The commands in the order they were received
+        :return: list of bools, whether the displayed information is changed by each command
+        """
+        indices = self.__received_commands(commands)
+        results = [False] * len(commands)
+        for i, result in zip(indices, await self.__router.dispatch_all_async([commands[i] for i in indices])):
+            results[i] = result
+        return results
+
     def handle_signal(self, signal, tb):
         raise Exception("Received signal %s"%signal)
 
 
-    def run(self):
+    def __open_output_pipe(self, output_pipe):
+        if isinstance(output_pipe, LazyFile):
+            # Blocks until the bar opens the fifo for reading
+            return os.open(output_pipe.name, os.O_WRONLY)
+        # The output closes its pipe, which must not close stdout
+        return os.dup(output_pipe.fileno())
+
+    def __open_command_pipe(self):
+        command_pipe = self.args.command_pipe
+        if isinstance(command_pipe, LazyFile):
+            # Opening the fifo read-write keeps a writer around, so it never reports EOF when a client disconnects
+            fd = os.open(command_pipe.name, os.O_RDWR | os.O_NONBLOCK)
+        else:
+            # The pipe is closed when the command sources are stopped, which must not close stdin
+            fd = os.dup(command_pipe.fileno())
+            os.set_blocking(fd, False)
+        return fd
+
+    def __start_command_sources(self, handler: callable):
+        command_fd = self.__open_command_pipe()
+        self.__loop.add_reader(command_fd, self.__read_commands, command_fd, handler)
+        self.__command_fd = command_fd
+        if self.args.command_socket is not None:
+            self.__command_server = CommandSocketServer(self.__loop, self.args.command_socket, handler)
+
+    def __stop_command_sources(self):
+        if self.__command_fd is not None:
+            self.__loop.remove_reader(self.__command_fd)
+            os.close(self.__command_fd)
+            self.__command_fd = None
+        if self.__command_server is not None:
+            self.__command_server.close()
+            self.__command_server = None
+
+    def __read_commands(self, fd, handler: callable):
+        """
+        Reads all commands that are buffered in the command pipe and passes them to the handler as one batch
+        """
+        chunks = [self.__command_buffer]
+        while True:
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                logger.warning('Command pipe was closed')
+                self.__loop.remove_reader(fd)
+                break
+            chunks.append(data)
+        lines = b''.join(chunks).split(b'\n')
+        self.__command_buffer = lines.pop()
+        if lines:
+            handler([line.decode('utf-8', 'replace').rstrip() for line in lines])
+
+    def __handle_commands(self, commands, reply: callable = None):
+        results = self.respond_to_batch(commands)
+        if any(results):
+            self.__request_frame()
+        if reply is not None:
+            reply(results)
+
+    def __request_frame(self):
+        """
+        Schedules a frame to be written at the end of the current loop iteration
+
+        All changes made during one iteration are rendered together in a single frame
+        """
+        if self.__frames_held:
+            self.__frame_deferred = True
+        elif not self.__frame_requested:
+            self.__frame_requested = True
+            self.__loop.call_soon(self.__write_frame)
+
+    def invalidate(self):
+        super().invalidate()
+        if self.runtime is not None:
+            self.__request_frame()
+
+    def __open_outputs(self):
+        # Every bar shows its own layout, without bars all output pipes show the application
+        views = self.__bars or [self] * len(self.args.output_pipes)
+        self.__outputs = [FrameWriter(self.__loop, self.__open_output_pipe(pipe)) for pipe in self.args.output_pipes]
+        self.__last_frames = [None] * len(self.__outputs)
+        self.__views = views
+
+    def __write_frame(self):
+        self.__frame_requested = False
+        for i, (view, output) in enumerate(zip(self.__views, self.__outputs)):
+            # Modules are cached, a module that is shown on several bars is only rendered once
+            frame = view.render()
+            if frame == self.__last_frames[i]:
+                self.__suppressed_frames += 1
+                logger.debug('Suppressed duplicate frame (%d so far)', self.__suppressed_frames)
+                continue
+            self.__last_frames[i] = frame
+            output.write(frame)
+        self.__record_state()
+
+    @property
+    def suppressed_frames(self) -> int:
+        """
+        :return: The number of rendered frames that were not written because they were identical to the previous frame
+        """
+        return self.__suppressed_frames
+
+    def __setup(self):
+        self.__profile = StartupProfile(_import_started)
+        self.__profile.end_phase('import')
         parser = argparse.ArgumentParser(description='Action manager for xmobar')
 
         self.set_name_ex('')
         self.configure(parser)
-        self.bind_arguments(parser.parse_args())
+        args = parser.parse_args()
+        if self.__bars and len(args.output_pipes) != len(self.__bars):
+            parser.error('%d output pipes are given for %d bars' % (len(args.output_pipes), len(self.__bars)))
+        self.__profile.end_phase('configure')
+        self.bind_arguments(args)
+        [bar.bind_arguments(args) for bar in self.__bars]
+        router = CommandRouter()
+        self.register_commands(router)
+        self.__router = router
+        self.__profile.end_phase('bind_arguments')
+        self.__command_buffer = b''
+        self.__frame_requested = False
+        self.__frames_held = False
+        self.__frame_deferred = False
+        self.__last_frames = []
+        self.__views = []
+        self.__suppressed_frames = 0
+        self.__outputs = []
+        self.__command_fd = None
+        self.__command_server = None
+        self.__state_journal = None
+
+    def __start(self):
+        """
+        Loads the state and writes the first frame, once the runtime is bound
+        """
+        self.__profile.end_phase('bind_runtime')
+        self.__load_state()
+        self.__profile.end_phase('load_state')
+        self.__open_outputs()
+        # Opening an output pipe waits for the bar, this is kept apart from the time spent by the daemon
+        self.__profile.end_phase('open_outputs')
+        self.__write_frame()
+        self.__profile.end_phase('first_frame')
+        if self.args.profile_startup:
+            sys.stderr.write('Startup profile:\n%s\n' % self.__profile.report())
+
+    def run(self):
+        """
+        Runs the daemon on the builtin event loop until it is stopped
+        """
+        self.__setup()
 
         for sig in {signal.SIGHUP, signal.SIGINT, signal.SIGQUIT, signal.SIGTERM}:
             signal.signal(sig, self.handle_signal)
 
+        self.__loop = EventLoop()
         try:
-            self.args.output_pipe.writelines(str(self)+"\n")
-            while True:
-                if self.respond_to_ex(str.rstrip(self.args.command_pipe.readline())) or self.periodic():
-                    self.args.output_pipe.writelines(str(self) + "\n")
-                else:
-                    time.sleep(1)
-        except BaseException as e:
+            self.__start_command_sources(self.__handle_commands)
+            self.bind_runtime(self.__create_runtime(Scheduler(self.__loop, self.__request_frame)))
+            self.__start()
+            self.__loop.run_forever()
+        except BaseException:
             logger.exception('Received exception, shutting down')
         finally:
             self.cleanup()
+            self.__loop.close()
+
+    def run_async(self):
+        """
+        Runs the daemon on an asyncio event loop until it is stopped
+
+        Coroutine versions of the module hooks are used, so modules that await I/O do not block each other.
+        """
+        # asyncio is only imported when the daemon runs on it
+        import asyncio
+        self.__setup()
+        asyncio.run(self.__main_async())
+
+    async def __main_async(self):
+        import asyncio
+        self.__loop = asyncio.get_running_loop()
+        main_task = asyncio.current_task()
+        commands = asyncio.Queue()
+        for sig in {signal.SIGHUP, signal.SIGINT, signal.SIGQUIT, signal.SIGTERM}:
+            self.__loop.add_signal_handler(sig, main_task.cancel)
+        try:
+            self.__start_command_sources(lambda batch, reply=None: commands.put_nowait((batch, reply)))
+            self.bind_runtime(self.__create_runtime(Scheduler(self.__loop, self.__request_frame, run_async=True)))
+            self.__start()
+            while True:
+                batch, reply = await commands.get()
+                # Commands of a batch may yield to the loop, frames are held until the whole batch is handled
+                self.__frames_held = True
+                try:
+                    results = await self.respond_to_batch_async(batch)
+                finally:
+                    self.__frames_held = False
+                if any(results) or self.__frame_deferred:
+                    self.__frame_deferred = False
+                    self.__request_frame()
+                if reply is not None:
+                    reply(results)
+        except BaseException:
+            logger.exception('Received exception, shutting down')
+        finally:
+            await self.cleanup_async()
@@ -1,13 +1,18 @@
-from collections import OrderedDict
+from __future__ import annotations
 
-import pulsectl
+import typing
 import logging
-from ..cycle import OrderedDictCycleAction
+from ..cycle import OrderedDictCycleAction, CycleRing
+from .registry import SinkRegistry
 from .naming_map import description
 from .sink_filter import all as sink_filter_all
 from .sink_input_filter import all as sink_input_filter_all
 from functools import partial
 
+if typing.TYPE_CHECKING:
+    # Only used in annotations, pulsectl is imported by the PulseService once a module uses pulseaudio
+    import pulsectl
+
 logger = logging.getLogger(__name__)
 
 __all__ = ['PulseCtlDefaultSinkCycleAction']
@@ -28,33 +33,47 @@ class PulseProxy:
             else:
                 return self.__realobj.default_sink_name
 
-    def __init__(self, name, sink_filter: callable, sink_input_filter: callable):
-        self.__pulse = pulsectl.Pulse(name)
+    def __init__(self, pulse, sink_filter: callable, sink_input_filter: callable):
+        """
+        :param pulse: The PulseService of the runtime
+        """
+        self.__pulse = pulse
         self.__sink_filter = partial(sink_filter, pulse=self)
-        self.__sink_input_filter = partial(sink_input_filter, pulse=self)
+        self.__sink_input_filter = partial(sink_input_filter, pulse=self, sink_filter=self.__filter_sink)
+        self.__filtered_sinks = {}
+        self.__filtered_generation = None
         self._fake_default_sink_name = None
         self._real_default_sink_name = None
 
     def server_info(self):
         return self.PulseServerInfo(self.__pulse.server_info(), self)
 
-    @property
-    def __real_default_sink(self):
-        default_sink_name = self.__pulse.server_info().default_sink_name
-        return self.__find_sink_by(lambda sink: sink.name == default_sink_name)
-
-    def sink_default_set(self, value: pulsectl.PulseSinkInfo):
-        real_default_sink = self.__real_default_sink
-        if not self.__sink_filter(real_default_sink):  # Current default sink is filtered out
+    def sink_default_set(self, value):
+        real_default_sink = self.__pulse.default_sink()
+        if real_default_sink is not None and not self.__filter_sink(real_default_sink):  # Current default sink is filtered out
             self._fake_default_sink_name = value.name  # Fake setting of default sink
             self._real_default_sink_name = real_default_sink.name  # Save real default sink
         else:  # Current default sink is not filtered out
-            self.__pulse.sink_default_set(value)
+            self.__pulse.sink_default_set(value.name)
             self._fake_default_sink_name = None
             self._real_default_sink_name = None
 
+    def __filter_sink(self, sink: pulsectl.PulseSinkInfo) -> bool:
+        """
+        Applies the sink filter, results are remembered per sink for as long as the snapshot is not invalidated
+        """
+        if self.__filtered_generation != self.__pulse.generation:
+            self.__filtered_sinks.clear()
+            self.__filtered_generation = self.__pulse.generation
+        key = (sink.index, sink.flags)
+        try:
+            return self.__filtered_sinks[key]
+        except KeyError:
+            selected = self.__filtered_sinks[key] = self.__sink_filter(sink)
+            return selected
+
     def sink_list(self):
-        return list(filter(self.__sink_filter, self.__pulse.sink_list()))
+        return list(filter(self.__filter_sink, self.__pulse.sink_list()))
 
     def sink_info(self, *a, **k):
         return self.__pulse.sink_info(*a, **k)
@@ -65,8 +84,8 @@ class PulseProxy:
     def sink_input_move(self, *a, **k):
         return self.__pulse.sink_input_move(*a, **k)
 
-    def __find_sink_by(self, filter_: callable):
-        return next(filter(filter_, self.__pulse.sink_list()))
+    def sink_input_move_all(self, *a, **k):
+        return self.__pulse.sink_input_move_all(*a, **k)
 
 
 class PulseCtlDefaultSinkCycleAction(OrderedDictCycleAction):
@@ -74,6 +93,10 @@ class PulseCtlDefaultSinkCycleAction(OrderedDictCycleAction):
     A cycle action that allows to select the pulseaudio fallback sink,
     and also moves active sink inputs to that sink.
     """
+
+    # Sinks are refreshed when pulseaudio reports a change
+    periodic_interval = None
+
     def __init__(self, naming_map: callable = description, sink_filter: callable = sink_filter_all,
                  sink_input_filter: callable = sink_input_filter_all):
         """
@@ -85,55 +108,63 @@ class PulseCtlDefaultSinkCycleAction(OrderedDictCycleAction):
             Must accept an arbitrary number of keyword arguments
             Sink inputs that do not match the filter are never moved
         """
-        self.__od = OrderedDict()
-        super().__init__(self.__od)
-        self.__pulse = PulseProxy(self.__class__.__name__, sink_filter=sink_filter,
-                                  sink_input_filter=partial(sink_input_filter, sink_filter=sink_filter))
-        self.__naming_func = partial(naming_map, pulse=self.__pulse)
+        self.__sinks = CycleRing()
+        super().__init__(self.__sinks)
+        self.__naming_map = naming_map
+        self.__sink_filter = sink_filter
+        self.__sink_input_filter = sink_input_filter
+        self.__pulse = None
+        self.__naming_func = None
+        self.__registry = SinkRegistry()
+        self.__registry.add_listener(self.__sinks_changed)
+
+    def bind_runtime(self, runtime):
+        super().bind_runtime(runtime)
+        self.__pulse = PulseProxy(runtime.pulse, sink_filter=self.__sink_filter, sink_input_filter=self.__sink_input_filter)
+        self.__naming_func = partial(self.__naming_map, pulse=self.__pulse)
+        runtime.pulse.add_listener(self.__pulse_changed)
         self.__update_items()
         self.current = self.__pulse.server_info().default_sink_name
 
     @OrderedDictCycleAction.current.setter
     def current(self, value):
-        # if self.current == value:
-        #    return
-        if value not in self.__od:
-            return
-
-        while self.current != value:
-            super().next()
+        self.seek_to(value)
 
+    def seek_to(self, key) -> bool:
+        # Jumps straight to the sink, it is the only one that becomes the default sink
+        if not super().seek_to(key):
+            return False
         self.__update_default_sink()
+        return True
 
     def __update_default_sink(self):
-        default_sink = self.__od[self.current]
+        default_sink = self.__sinks[self.current]
 
         self.__pulse.sink_default_set(default_sink)
         logger.debug('%s.__update_default_sink: Set default sink to %r', self.__class__.__name__, default_sink)
-        for sink_input in self.__pulse.sink_input_list():
-            try:
-                self.__pulse.sink_input_move(sink_input.index, default_sink.index)
-                logger.debug('%s.__move_sink_inputs: Moved sink input %r to sink %r', self.__class__.__name__,
-                             sink_input, default_sink)
-            except pulsectl.PulseOperationFailed:
-                logger.exception('Failed moving sink input %d to sink %d', sink_input.index, default_sink.index)
+        # The streams are moved in the background, the bar does not wait for them
+        sink_inputs = [sink_input.index for sink_input in self.__pulse.sink_input_list()]
+        self.__pulse.sink_input_move_all(sink_inputs, default_sink.index, partial(self.__sink_inputs_moved, default_sink))
+
+    def __sink_inputs_moved(self, default_sink, failed: list):
+        if failed:
+            logger.error('Failed moving sink inputs %r to sink %d', failed, default_sink.index)
+        else:
+            logger.debug('%s.__sink_inputs_moved: Moved sink inputs to sink %r', self.__class__.__name__, default_sink)
+
+    def __sinks_changed(self, diff):
+        # Records of changed sinks replace the old ones at the same position in the cycle
+        for record in diff.removed:
+            logger.debug('%s.__sinks_changed: Removed sink %r', self.__class__.__name__, record)
+            del self.__sinks[record.name]
+        for record in diff.added:
+            logger.debug('%s.__sinks_changed: Added sink %r', self.__class__.__name__, record)
+            self.__sinks[record.name] = record
+        for record in diff.changed:
+            self.__sinks[record.name] = record
 
     def __update_items(self):
-        changed = False
-        sinks = self.__pulse.sink_list()
-        for sink in sinks:
-            if sink.name not in self.__od:
-                logger.debug('%s.__update_items: Added sink %r', self.__class__.__name__, sink)
-                changed = True
-            self.__od[sink.name] = sink
-        to_delete = []
-        for k, sink in self.__od.items():
-            if len(list(filter(lambda s: s.name == sink.name, sinks))) == 0:  # Sink from dict not in sinks list
-                logger.debug('%s.__update_items: Removed sink %r', self.__class__.__name__, sink)
-                to_delete.append(k)
-                changed = True
-        for k in to_delete:
-            del self.__od[k]
+        changed = bool(self.__registry.update(self.__pulse.sink_list()))
 
         default_name = self.__pulse.server_info().default_sink_name
         if self.current != default_name:
@@ -142,13 +173,16 @@ class PulseCtlDefaultSinkCycleAction(OrderedDictCycleAction):
             changed = True
         return changed
 
-    def periodic(self):
-        return self.__update_items()
+    def __pulse_changed(self, changes: set):
+        # Moving sink inputs around does not change the sinks that can be cycled through
+        if all(facility == 'sink_input' for facility, _ in changes):
+            return
+        if self.__update_items():
+            self.invalidate()
 
     @property
     def items(self):
-        self.__update_items()
-        return map(self.__naming_func, super().items())
+        return ((name, self.__naming_func(sink)) for name, sink in super().items)
 
     def prev(self):
         super().prev()
@@ -158,5 +192,10 @@ class PulseCtlDefaultSinkCycleAction(OrderedDictCycleAction):
         super().next()
         self.__update_default_sink()
 
+    def seek(self, offset: int):
+        # Only the sink that is reached becomes the default sink
+        super().seek(offset)
+        self.__update_default_sink()
+
     def __str__(self):
-        return self.__naming_func(self.__od[self.current])
+        return self.__naming_func(self.__sinks[self.current])
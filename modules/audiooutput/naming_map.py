@@ -1,6 +1,11 @@
-import pulsectl
+from __future__ import annotations
+
+import typing
 from ..functional import *
 
+if typing.TYPE_CHECKING:
+    import pulsectl
+
 
 def description(sink: pulsectl.PulseSinkInfo, **k) -> str:
     """
@@ -0,0 +1,128 @@
+import logging
+
+__all__ = ['SinkRecord', 'SinkDiff', 'SinkRegistry']
+
+logger = logging.getLogger(__name__)
+
+
+class SinkRecord:
+    """
+    The properties of a sink that are used by naming maps and sink filters
+
+    Records are kept instead of the full sink info objects, which carry all properties of the sink.
+    """
+    __slots__ = ('name', 'index', 'description', 'flags')
+
+    def __init__(self, name: str, index: int, description: str, flags: int):
+        self.name = name
+        self.index = index
+        self.description = description
+        self.flags = flags
+
+    @classmethod
+    def from_sink_info(cls, sink):
+        """
+        :param sink: A pulsectl.PulseSinkInfo
+        :return: SinkRecord
+        """
+        return cls(sink.name, sink.index, sink.description, sink.flags)
+
+    def __eq__(self, other):
+        if not isinstance(other, SinkRecord):
+            return NotImplemented
+        return (self.name, self.index, self.description, self.flags) == (other.name, other.index, other.description, other.flags)
+
+    def __hash__(self):
+        return hash((self.name, self.index))
+
+    def __repr__(self):
+        return '%s(%r, %r, %r, %r)' % (self.__class__.__name__, self.name, self.index, self.description, self.flags)
+
+
+class SinkDiff:
+    """
+    The differences between two updates of a SinkRegistry
+    """
+    __slots__ = ('added', 'removed', 'changed')
+
+    def __init__(self, added: list, removed: list, changed: list):
+        """
+        :param added: Records of sinks that are new
+        :param removed: Records of sinks that are gone
+        :param changed: Records of sinks with the same name whose index, description or flags changed
+        """
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return '%s(added=%r, removed=%r, changed=%r)' % (self.__class__.__name__, self.added, self.removed, self.changed)
+
+
+class SinkRegistry:
+    """
+    The known sinks, keyed by name and by index
+
+    Every update is compared with the previous one in linear time,
+    the differences are reported to the listeners of the registry.
+    """
+
+    def __init__(self):
+        self.__by_name = {}
+        self.__by_index = {}
+        self.__listeners = []
+
+    def add_listener(self, listener: callable):
+        """
+        :param listener: Called with a SinkDiff after an update that changed the registry
+        """
+        self.__listeners.append(listener)
+
+    def by_name(self, name: str) -> SinkRecord:
+        """
+        :return: The record of the sink with a name, or None
+        """
+        return self.__by_name.get(name)
+
+    def by_index(self, index: int) -> SinkRecord:
+        """
+        :return: The record of the sink with an index, or None
+        """
+        return self.__by_index.get(index)
+
+    def __iter__(self):
+        return iter(self.__by_name.values())
+
+    def __len__(self):
+        return len(self.__by_name)
+
+    def update(self, sinks) -> SinkDiff:
+        """
+        Replaces the known sinks
+
+        :param sinks: Iterable of pulsectl.PulseSinkInfo
+        :return: SinkDiff The differences with the previous update
+        """
+        by_name = {}
+        added = []
+        changed = []
+        for sink in sinks:
+            record = SinkRecord.from_sink_info(sink)
+            by_name[record.name] = record
+            previous = self.__by_name.get(record.name)
+            if previous is None:
+                added.append(record)
+            elif previous != record:
+                changed.append(record)
+        removed = [record for name, record in self.__by_name.items() if name not in by_name]
+        self.__by_name = by_name
+        self.__by_index = {record.index: record for record in by_name.values()}
+        diff = SinkDiff(added, removed, changed)
+        if diff:
+            logger.debug('%s.update: %r', self.__class__.__name__, diff)
+            for listener in self.__listeners:
+                listener(diff)
+        return diff
@@ -1,4 +1,9 @@
-import pulsectl
+from __future__ import annotations
+
+import typing
+
+if typing.TYPE_CHECKING:
+    import pulsectl
 
 __all__ = ['hardware_only', 'virtual_only', 'all']
 
@@ -1,6 +1,11 @@
-import pulsectl
+from __future__ import annotations
+
+import typing
 import logging
 
+if typing.TYPE_CHECKING:
+    import pulsectl
+
 __all__ = ['all', 'connected_sink']
 logger = logging.getLogger(__name__)
 
@@ -16,5 +21,12 @@ def connected_sink(sink_input: pulsectl.PulseSinkInputInfo, sink_filter: callabl
     """
     Selects all output devices that are attached to a sink matching a sink filter
     """
-    sink = pulse.sink_info(sink_input.sink)
+    import pulsectl
+    # Looked up in the snapshot of the sinks, this does not query the server for every sink input
+    try:
+        sink = pulse.sink_info(sink_input.sink)
+    except pulsectl.PulseIndexError:
+        # The sink was added after the snapshot was taken, the sink input is selected once the sinks are updated
+        logger.debug('Sink %d of sink input %d is not known yet', sink_input.sink, sink_input.index)
+        return False
     return sink_filter(sink)
@@ -2,7 +2,6 @@ import subprocess
 import logging
 
 from .toggle import ToggleControl
-from .util import process_reaper, backoff
 
 __all__ = ['CaffeineControl']
 
@@ -10,8 +9,11 @@ logger = logging.getLogger(__name__)
 
 
 class CaffeineControl(ToggleControl):
+    periodic_interval = 10
+
     def __init__(self, letter: str = 'c'):
         super().__init__(letter, False)
+        self.__poke_process = None
 
     def configure(self, argument_parser):
         argument_parser.add_argument('--caffeine-timeout',
@@ -21,11 +23,16 @@ class CaffeineControl(ToggleControl):
 
     def bind_arguments(self, args):
         super().bind_arguments(args)
-        self.periodic = process_reaper(backoff(self.args.caffeine_timeout)(self.__periodic))
+        self.periodic_interval = self.args.caffeine_timeout
 
-    def __periodic(self):
-        if self.state:
+    def periodic(self):
+        # A poke that has not finished yet is not repeated
+        if self.state and self.__poke_process is None:
             logger.debug("Poking screensaver")
-            return subprocess.Popen(['xscreensaver-command', '-deactivate'],
-                                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
-                                    stderr=subprocess.DEVNULL)
+            self.__poke_process = self.runtime.supervisor.spawn(['xscreensaver-command', '-deactivate'],
+                                                                on_exit=self.__poked,
+                                                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                                                stderr=subprocess.DEVNULL)
+
+    def __poked(self, process):
+        self.__poke_process = None
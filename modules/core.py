@@ -6,6 +6,8 @@ import sys
 import enum
 import logging
 
+from . import markup
+
 __all__ = ['AbstractControl', 'GroupedControl', 'WrappingControl', 'ActionWrapperControl', 'Button']
 
 logger = logging.getLogger(__name__)
@@ -16,12 +18,30 @@ class AbstractControl(metaclass=abc.ABCMeta):
     Base class for all modules
     """
 
+    #: Seconds between two calls of periodic(), or None when the module does not need periodic() to be called.
+    #: May be changed at runtime, the new interval is used after the next call of periodic().
+    periodic_interval = 1.0
+
+    #: Whether periodic() calls are aligned on multiples of periodic_interval of the wall clock
+    periodic_align = False
+
+    #: Plain (not namespaced) commands handled by respond_to(),
+    #: or None when the module wants to receive every plain command.
+    plain_commands = None
+
+    #: Prefixes of parameterized plain commands handled by respond_to()
+    plain_command_prefixes = ()
+
     def __init__(self):
         """
         Creates a new control
         """
         self.args = None
+        self.runtime = None
         self.__name = None
+        self.__parents = []
+        self.__fragment = None
+        self.__actions = {}
 
     @property
     def visible(self):
@@ -61,10 +81,27 @@ class AbstractControl(metaclass=abc.ABCMeta):
         :return: void
         """
         self.args = args
+        self.__actions.clear()
+
+    def bind_runtime(self, runtime):
+        """
+        Binds the services of the running daemon to this module.
+
+        Called after bind_arguments(), for modules that report to be enabled.
+        Schedules periodic() to be called every periodic_interval seconds.
+
+        When overriding this method, the parent function always has to be called.
+
+        :param runtime: The Runtime of the daemon
+        :return: void
+        """
+        self.runtime = runtime
+        if self.periodic_interval is not None:
+            runtime.scheduler.add(self)
 
     def periodic(self):
         """
-        Called periodically during the runtime of the daemon.
+        Called periodically during the runtime of the daemon, every periodic_interval seconds.
 
         Actions that are independent of user input should be handled here,
         use respond_to() to handle user input.
@@ -75,6 +112,17 @@ class AbstractControl(metaclass=abc.ABCMeta):
         """
         return False
 
+    async def periodic_async(self):
+        """
+        Coroutine version of periodic(), used when the daemon runs on an asyncio event loop.
+
+        Modules that perform I/O can override this method to await it instead of blocking other modules.
+        The default implementation calls periodic()
+
+        :return: bool Whether the displayed information is changed by the executed operations.
+        """
+        return self.periodic()
+
     def cleanup(self):
         """
         Called during the shutdown of the daemon to clean up the module's resources.
@@ -84,6 +132,15 @@ class AbstractControl(metaclass=abc.ABCMeta):
         """
         pass
 
+    async def cleanup_async(self):
+        """
+        Coroutine version of cleanup(), used when the daemon runs on an asyncio event loop.
+
+        The default implementation calls cleanup()
+        :return: void
+        """
+        self.cleanup()
+
     def respond_to(self, command: str):
         """
         Responds to a user command
@@ -97,6 +154,30 @@ class AbstractControl(metaclass=abc.ABCMeta):
         """
         return False
 
+    async def respond_to_async(self, command: str):
+        """
+        Coroutine version of respond_to(), used when the daemon runs on an asyncio event loop.
+
+        The default implementation calls respond_to()
+        :param command: The command received from the user
+        :return: bool Whether the displayed information is changed by the executed operations.
+        """
+        return self.respond_to(command)
+
+    def coalesce(self, commands: list) -> list:
+        """
+        Folds a run of consecutive commands for this module into their net effect
+
+        Called before a batch of commands is passed to respond_to(), with commands as they would be passed to respond_to().
+        Additive commands can be summed and idempotent commands can be reduced to the last one,
+        commands that cannot be folded must be kept in their order.
+        The default implementation does not fold any commands.
+
+        :param commands: Consecutive commands for this module
+        :return: list The commands to pass to respond_to() instead
+        """
+        return commands
+
     def respond_to_ex(self, command: str):
         """
         Responds to a non-cleaned user command
@@ -107,20 +188,51 @@ class AbstractControl(metaclass=abc.ABCMeta):
         :param command: The uncleaned command from the user
         :return: bool Whether the displayed information is changed by the executed operations.
         """
+        command = self.__clean_command(command)
+        if command is None:
+            return False
+        changed = self.respond_to(command)
+        if changed:
+            self.invalidate()
+        return changed
+
+    async def respond_to_ex_async(self, command: str):
+        """
+        Coroutine version of respond_to_ex()
+
+        :param command: The uncleaned command from the user
+        :return: bool Whether the displayed information is changed by the executed operations.
+        """
+        command = self.__clean_command(command)
+        if command is None:
+            return False
+        changed = await self.respond_to_async(command)
+        if changed:
+            self.invalidate()
+        return changed
+
+    def __clean_command(self, command: str):
+        """
+        Removes the namespace of this class from a namespaced command
+
+        :param command: The uncleaned command from the user
+        :return: str|None The command to pass to respond_to(), or None if the command is not meant for this module
+        """
         logger.debug('%s.respond_to_ex: %s', self.__class__.__name__, command)
         if command[0] == ':':
             split_command = command.split(':', 2)
             if len(split_command) == 3:
                 if split_command[1] != self.get_namespace():
                     logger.error('%s.respond_to_ex: Unsollicited command (mismatch %s <-> %s)', self.__class__.__name__, split_command[1], self.get_namespace())
-                    return False
+                    return None
                 command = ':' + split_command[2]
                 logger.debug('%s.respond_to: %s', self.__class__.__name__, command)
-                return self.respond_to(command)
+                return command
             logger.warning('%s.respond_to_ex: Could not split into full command.', self.__class__.__name__)
+            return None
         else:
             logger.debug('%s.respond_to: %s', self.__class__.__name__, command)
-            return self.respond_to(command)
+            return command
 
     def __str__(self):
         """
@@ -131,6 +243,52 @@ class AbstractControl(metaclass=abc.ABCMeta):
         """
         return super().__str__()
 
+    def markup(self):
+        """
+        Creates the markup of the module to show on the action bar
+
+        Modules that apply actions should override this method instead of __str__(),
+        so wrapping modules can operate on the actions without parsing them.
+        The default implementation returns the string representation of the module.
+
+        Will only be called for modules that report to be visible
+        :return: Markup, see modules.markup
+        """
+        return str(self)
+
+    def add_parent(self, parent):
+        """
+        Registers a control that includes the output of this control in its own output
+
+        :param parent: The control that renders this control
+        :return: void
+        """
+        self.__parents.append(parent)
+
+    def invalidate(self):
+        """
+        Marks the output of this control as outdated, so it is rendered again on the next frame
+
+        Parents are invalidated as well, because their output contains the output of this control.
+        Must be called whenever the state that is shown by the module changes, this is done automatically
+        when respond_to() or periodic() report a change.
+        :return: void
+        """
+        self.__fragment = None
+        for parent in self.__parents:
+            parent.invalidate()
+
+    def render(self):
+        """
+        Renders the module, reusing the previous output when the control was not invalidated since
+
+        Will only be called for modules that report to be visible
+        :return: str
+        """
+        if self.__fragment is None:
+            self.__fragment = markup.render(self.markup())
+        return self.__fragment
+
     def load_state(self, state):
         """
         Loads state previously saved by this module
@@ -196,8 +354,22 @@ class AbstractControl(metaclass=abc.ABCMeta):
         :param name: The namespace to use for namespaced commands
         """
         self.__name = name
+        self.__actions.clear()
         logger.debug('%s.set_name: Set name to %s', self.__class__.__name__, name)
 
+    def register_commands(self, router):
+        """
+        Registers the commands handled by this module with the command router
+
+        Called once the namespaces of all modules are set, for modules that report to be enabled.
+        Controls that wrap other controls must register their children as well.
+
+        :param router: The CommandRouter of the daemon
+        :return: void
+        """
+        router.add_namespace(self.__name, self)
+        router.add_plain_commands(self, self.plain_commands, self.plain_command_prefixes)
+
     def set_name_ex(self, name: str):
         """
         Sets the namespace to use for namespaced commands
@@ -207,15 +379,35 @@ class AbstractControl(metaclass=abc.ABCMeta):
         """
         self.set_name('%s:%s' % (name, self.get_namespace()))
 
+    def create_action(self, command: str, button=None):
+        """
+        Creates an action that passes :command to the daemon, see create_pipe_command()
+
+        Actions are kept by the control, so the shell command is only created the first time.
+
+        :param command: The command to pass
+        :param button: Optionally, which buttons will trigger the command (May be a Button, or a number of OR-ed buttons)
+        :return: ActionTemplate
+        """
+        try:
+            return self.__actions[command, button]
+        except KeyError:
+            template = self.__actions[command, button] = markup.ActionTemplate(self.create_pipe_command(command), button)
+            return template
+
     def create_pipe_command(self, command: str):
         """
-        Creates a shell command that will pass :command to the daemon through the controlpipe
+        Creates a shell command that will pass :command to the daemon through the command socket,
+        or through the controlpipe when no command socket is configured.
 
         :param command: The command to pass
-        :return: str Shell command that will pass the given command through the controlpipe
+        :return: str Shell command that will pass the given command to the daemon
         """
         if command[0] == ':':
             command = self.__name + command
+        if getattr(self.args, 'command_socket', None):
+            return '{} -S {}/command.py {} {}'.format(sys.executable, os.path.abspath(sys.path[0]),
+                                                      os.path.abspath(self.args.command_socket), command)
         return '{}/command.sh {} {}'.format(os.path.abspath(sys.path[0]), command,
                                             os.path.abspath(self.args.command_pipe.name))
 
@@ -225,6 +417,9 @@ class GroupedControl(AbstractControl):
     Groups a set of modules into one module, separated by a given string
     """
 
+    periodic_interval = None
+    plain_commands = frozenset()
+
     def __init__(self, *modules, separator=' | '):
         """
         Creates a new grouped control
@@ -235,18 +430,28 @@ class GroupedControl(AbstractControl):
         super().__init__()
         self.__modules = modules
         self.__separator = separator
+        for m in modules:
+            m.add_parent(self)
 
     def bind_arguments(self, args):
         super().bind_arguments(args)
         [m.bind_arguments(args) for m in self.__modules]
 
+    def bind_runtime(self, runtime):
+        super().bind_runtime(runtime)
+        [m.bind_runtime(runtime) for m in self.__modules if m.enabled]
+
+    def register_commands(self, router):
+        super().register_commands(router)
+        [m.register_commands(router) for m in self.__modules if m.enabled]
+
     @property
     def enabled(self):
-        return any([m.enabled for m in self.__modules])
+        return any(m.enabled for m in self.__modules)
 
     @property
     def visible(self):
-        return any([m.visible for m in self.__modules if m.enabled])
+        return any(m.visible for m in self.__modules if m.enabled)
 
     def configure(self, argument_parser):
         [m.configure(argument_parser) for m in self.__modules]
@@ -257,16 +462,41 @@ class GroupedControl(AbstractControl):
     def cleanup(self):
         [m.cleanup() for m in self.__modules if m.enabled]
 
+    async def cleanup_async(self):
+        await _gather(*[m.cleanup_async() for m in self.__modules if m.enabled])
+
     def respond_to(self, command):
         if command[0] != ':':
-            return any([m.respond_to(command) for m in self.__modules if m.enabled])
+            return self.__invalidate_changed([(m, m.respond_to(command)) for m in self.__modules if m.enabled])
         split_command = command.split(':', maxsplit=2)
         if len(split_command) == 3:
             index = int(split_command[1])
             return self.__modules[index].respond_to_ex(':' + split_command[2])
 
+    async def respond_to_async(self, command):
+        if command[0] != ':':
+            modules = [m for m in self.__modules if m.enabled]
+            return self.__invalidate_changed(zip(modules, await _gather(*[m.respond_to_async(command) for m in modules])))
+        split_command = command.split(':', maxsplit=2)
+        if len(split_command) == 3:
+            index = int(split_command[1])
+            return await self.__modules[index].respond_to_ex_async(':' + split_command[2])
+
     def periodic(self):
-        return any([m.periodic() for m in self.__modules if m.enabled])
+        return self.__invalidate_changed([(m, m.periodic()) for m in self.__modules if m.enabled])
+
+    async def periodic_async(self):
+        modules = [m for m in self.__modules if m.enabled]
+        return self.__invalidate_changed(zip(modules, await _gather(*[m.periodic_async() for m in modules])))
+
+    @staticmethod
+    def __invalidate_changed(results):
+        changed = False
+        for m, module_changed in results:
+            if module_changed:
+                m.invalidate()
+                changed = True
+        return changed
 
     def dump_state_ex(self):
         data = dict()
@@ -284,7 +514,13 @@ class GroupedControl(AbstractControl):
         return s
 
     def __str__(self):
-        return self.__separator.join([self.__passthrough_log('__str__', str(m)) for m in self.__modules if m.visible])
+        return self.__separator.join([self.__passthrough_log('__str__', m.render()) for m in self.__modules if m.visible])
+
+
+def _gather(*coroutines):
+    # asyncio is only imported when the daemon runs on it
+    import asyncio
+    return asyncio.gather(*coroutines)
 
 
 def action(command, text, **kwargs):
@@ -306,8 +542,14 @@ class WrappingControl(AbstractControl):
 
     All method calls are passed through to the child module.
     This wrapper does not affect the state, it is passed through cleanly
+
+    Plain commands are routed to the child directly,
+    subclasses that handle plain commands themselves have to declare them in plain_commands.
     """
 
+    periodic_interval = None
+    plain_commands = frozenset()
+
     def __init__(self, child_control: AbstractControl) -> None:
         """
         Creates a new module wrapper
@@ -316,10 +558,17 @@ class WrappingControl(AbstractControl):
         """
         super().__init__()
         self.child = child_control
+        child_control.add_parent(self)
 
     def cleanup(self):
         self.child.cleanup()
 
+    async def cleanup_async(self):
+        if type(self).cleanup is not WrappingControl.cleanup:
+            # A subclass customized cleanup(), which takes precedence over the child's coroutine
+            return self.cleanup()
+        await self.child.cleanup_async()
+
     def dump_state_ex(self):
         return self.child.dump_state_ex()
 
@@ -330,6 +579,12 @@ class WrappingControl(AbstractControl):
         logging.debug('%s.respond_to: Passing command "%s" to child', self.__class__.__name__, command)
         return self.child.respond_to_ex(command)
 
+    async def respond_to_async(self, command):
+        if type(self).respond_to is not WrappingControl.respond_to:
+            # A subclass customized respond_to(), which takes precedence over the child's coroutine
+            return self.respond_to(command)
+        return await self.child.respond_to_ex_async(command)
+
     @property
     def enabled(self):
         return self.child.enabled
@@ -344,6 +599,14 @@ class WrappingControl(AbstractControl):
         super().bind_arguments(args)
         self.child.bind_arguments(args)
 
+    def bind_runtime(self, runtime):
+        super().bind_runtime(runtime)
+        self.child.bind_runtime(runtime)
+
+    def register_commands(self, router):
+        super().register_commands(router)
+        self.child.register_commands(router)
+
     @property
     def visible(self):
         return self.child.visible
@@ -351,6 +614,12 @@ class WrappingControl(AbstractControl):
     def periodic(self):
         return self.child.periodic()
 
+    async def periodic_async(self):
+        if type(self).periodic is not WrappingControl.periodic:
+            # A subclass customized periodic(), which takes precedence over the child's coroutine
+            return self.periodic()
+        return await self.child.periodic_async()
+
     def load_state_ex(self, state):
         self.child.load_state_ex(state)
 
@@ -359,7 +628,7 @@ class WrappingControl(AbstractControl):
         self.child.set_name_ex(name)
 
     def __str__(self):
-        return self.child.__str__()
+        return self.child.render()
 
 
 class ActionWrapperControl(WrappingControl):
@@ -376,14 +645,10 @@ class ActionWrapperControl(WrappingControl):
         :param buttons: Optionally, which buttons will trigger the shell command (May be a Button, or a number of OR-ed buttons)
         """
         super().__init__(control)
-        self.__action = action
-        self.__buttons = buttons
+        self.__template = markup.ActionTemplate(action, buttons or None)
 
-    def __str__(self):
-        if self.__buttons:
-            return action(self.__action, super().__str__(), button=self.__buttons)
-        else:
-            return action(self.__action, super().__str__())
+    def markup(self):
+        return self.__template(super().__str__())
 
 
 @enum.unique
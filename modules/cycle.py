@@ -1,18 +1,113 @@
 import abc
 from collections import OrderedDict
+from collections.abc import MutableMapping
 
-from .core import AbstractControl, WrappingControl, action, Button
+from .core import AbstractControl, WrappingControl, Button
 import logging
 
-__all__ = ['AbstractCycleAction', 'OrderedDictCycleAction', 'CycleControl', 'ExpandedCycleControlAction']
+__all__ = ['AbstractCycleAction', 'CycleRing', 'OrderedDictCycleAction', 'CycleControl', 'ExpandedCycleControlAction']
 logger = logging.getLogger(__name__)
 
 
+class CycleRing(MutableMapping):
+    """
+    A mapping that keeps its items in insertion order, with a pointer to the current item
+
+    Moving the pointer forward, backward or to a key takes constant time, the order of the items never changes.
+    When the current item is removed, the item after it becomes the current item.
+    """
+
+    def __init__(self, items=None):
+        """
+        :param items: Optionally, a mapping with the initial items. Its first item becomes the current item
+        """
+        self.__keys = []
+        self.__values = {}
+        self.__positions = {}
+        self.__index = 0
+        if items is not None:
+            self.update(items)
+
+    @property
+    def current(self):
+        """
+        :return: The key of the current item, or None when there are no items
+        """
+        if not self.__keys:
+            return None
+        return self.__keys[self.__index]
+
+    def seek(self, offset: int):
+        """
+        Moves the pointer a number of items forward or backward, wrapping around at the ends
+
+        :param offset: Number of items to move, negative to move backward
+        """
+        if self.__keys:
+            self.__index = (self.__index + offset) % len(self.__keys)
+
+    def seek_to(self, key):
+        """
+        Moves the pointer to an item
+
+        :param key: The key of the item
+        :raises KeyError: When there is no item with the key
+        """
+        self.__index = self.__positions[key]
+
+    def rotated(self) -> list:
+        """
+        :return: All keys, starting from the current one and wrapping around at the end
+        """
+        return self.__keys[self.__index:] + self.__keys[:self.__index]
+
+    def __getitem__(self, key):
+        return self.__values[key]
+
+    def __setitem__(self, key, value):
+        if key not in self.__values:
+            self.__positions[key] = len(self.__keys)
+            self.__keys.append(key)
+        self.__values[key] = value
+
+    def __delitem__(self, key):
+        position = self.__positions.pop(key)
+        del self.__values[key]
+        del self.__keys[position]
+        for k in self.__keys[position:]:
+            self.__positions[k] -= 1
+        if position < self.__index:
+            self.__index -= 1
+        if self.__index >= len(self.__keys):
+            self.__index = 0
+
+    def __contains__(self, key):
+        return key in self.__values
+
+    def __iter__(self):
+        return iter(self.__keys)
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def clear(self):
+        self.__keys.clear()
+        self.__values.clear()
+        self.__positions.clear()
+        self.__index = 0
+
+    def __repr__(self):
+        return '%s(%r, current=%r)' % (self.__class__.__name__, [(k, self.__values[k]) for k in self.__keys], self.current)
+
+
 class AbstractCycleAction(AbstractControl, metaclass=abc.ABCMeta):
     """
     Base class for all cycle actions
     """
 
+    periodic_interval = None
+    plain_commands = frozenset()
+
     @abc.abstractmethod
     def next(self):
         """
@@ -27,6 +122,36 @@ class AbstractCycleAction(AbstractControl, metaclass=abc.ABCMeta):
         """
         pass
 
+    def seek(self, offset: int):
+        """
+        Moves a number of items forward or backward in the cycle
+
+        The default implementation calls next() or prev() for every item,
+        implementations that apply the current item somewhere should only apply the item that is reached.
+
+        :param offset: Number of items to move, negative to move backward
+        """
+        step = self.next if offset > 0 else self.prev
+        for i in range(abs(offset)):
+            step()
+
+    def seek_to(self, key) -> bool:
+        """
+        Moves to an item in the cycle
+
+        The default implementation calls next() until the item is reached,
+        implementations that apply the current item somewhere should only apply the item that is reached.
+
+        :param key: The unique identifier of the item
+        :return: bool Whether the item is present in the cycle
+        """
+        start = self.current
+        while self.current != key:
+            self.next()
+            if self.current == start:
+                return False
+        return True
+
     @abc.abstractproperty
     def current(self) -> object:
         """
@@ -42,13 +167,9 @@ class AbstractCycleAction(AbstractControl, metaclass=abc.ABCMeta):
         return iter([])
 
     def load_state(self, state):
-        if 'current' in state:
-            prev_current = self.current
-            while self.current != state['current']:
-                self.next()
-                if prev_current == state['current']:
-                    logger.warning('%s.load_state: Saved item is not present in cycle.', self.__class__.__name__)
-                    break
+        if 'current' in state and state['current'] != self.current:
+            if not self.seek_to(state['current']):
+                logger.warning('%s.load_state: Saved item is not present in cycle.', self.__class__.__name__)
 
     def dump_state(self):
         return {'current': self.current}
@@ -64,26 +185,29 @@ class OrderedDictCycleAction(AbstractCycleAction):
     """
     A cycle action that cycles through an ordered dictionary.
     Dictionary keys are used as unique identifiers, dictionary values are their visual represenation
+
+    The items are kept in a CycleRing. Subclasses that change the items while the cycle is in use
+    pass their own CycleRing, which is used as is, other mappings are copied.
     """
     def __init__(self, items: OrderedDict = None):
         super().__init__()
-        self.__items = items if items is not None else OrderedDict()
+        self.__items = items if isinstance(items, CycleRing) else CycleRing(items)
 
     def prev(self):
-        # prev: a b c -> c a b
-        #       ^        ^
-        #       Move last item to front
-        for k in reversed(self.__items.keys()):
-            self.__items.move_to_end(k, last=False)
-            break
+        self.__items.seek(-1)
 
     def next(self):
-        # next: a b c -> b c a
-        #       ^        ^
-        #       Move first item to back
-        for k in self.__items.keys():
-            self.__items.move_to_end(k)
-            break
+        self.__items.seek(1)
+
+    def seek(self, offset: int):
+        # Moves the pointer, without calling next() or prev() for the intermediate items
+        self.__items.seek(offset)
+
+    def seek_to(self, key) -> bool:
+        if key not in self.__items:
+            return False
+        self.__items.seek_to(key)
+        return True
 
     @property
     def items(self):
@@ -91,15 +215,13 @@ class OrderedDictCycleAction(AbstractCycleAction):
 
     @property
     def current(self):
-        for k in self.__items.keys():
-            return k
+        return self.__items.current
 
     @current.setter
     def current(self, value):
-        if value not in self.__items.keys():
+        if value not in self.__items:
             raise ValueError("The given value is not a valid item")
-        while self.current != value:
-            self.__items.move_to_end(self.current)
+        self.__items.seek_to(value)
 
     @property
     def visible(self):
@@ -126,28 +248,42 @@ class CycleControl(WrappingControl):
     def respond_to(self, command: str):
         if command == ':next':
             self.child.next()
+            self.child.invalidate()
             return True
         elif command == ':prev':
             self.child.prev()
+            self.child.invalidate()
+            return True
+        elif command.startswith(':seek:'):
+            self.child.seek(int(command[6:]))
+            self.child.invalidate()
             return True
         else:
             return super().respond_to(command)
 
-    def __str__(self):
+    def coalesce(self, commands):
+        # Runs of :next and :prev are folded into a single :seek to the item that is reached
+        coalesced = []
+        for command in commands:
+            step = {':next': 1, ':prev': -1}.get(command)
+            if step is None:
+                coalesced.append(command)
+                continue
+            if coalesced and coalesced[-1].startswith(':seek:'):
+                step += int(coalesced.pop()[6:])
+            if step != 0:
+                coalesced.append(':seek:%d' % step)
+        return coalesced
+
+    def markup(self):
         next_button = Button.LEFT
         prev_button = Button.RIGHT
         if self.__scroll_actions:
             next_button |= Button.SCROLL_UP
             prev_button |= Button.SCROLL_DOWN
-        return action(
-            command=self.create_pipe_command(':next'),
-            button=next_button,
-            text=action(
-                command=self.create_pipe_command(':prev'),
-                button=prev_button,
-                text=str(self.child)
-            )
-        )
+        next_action = self.create_action(':next', button=next_button)
+        prev_action = self.create_action(':prev', button=prev_button)
+        return next_action(prev_action(self.child.render()))
 
 
 class ExpandedCycleControlAction(WrappingControl, AbstractCycleAction):
@@ -162,9 +298,20 @@ class ExpandedCycleControlAction(WrappingControl, AbstractCycleAction):
 
     def next(self):
         self.child.next()
+        self.child.invalidate()
 
     def prev(self):
         self.child.prev()
+        self.child.invalidate()
+
+    def seek(self, offset: int):
+        self.child.seek(offset)
+        self.child.invalidate()
+
+    def seek_to(self, key) -> bool:
+        found = self.child.seek_to(key)
+        self.child.invalidate()
+        return found
 
     @property
     def items(self):
@@ -180,16 +327,23 @@ class ExpandedCycleControlAction(WrappingControl, AbstractCycleAction):
     def respond_to(self, command: str):
         for item_key, _ in self.items:
             if command == self.__get_control_command(item_key):
-                prev_current = self.current
-                while self.current != item_key:
-                    self.next()
-                    if self.current == prev_current:
-                        logger.error('%s.respond_to: Item %s not found in cycle.', self.__class__.__name__, item_key)
+                if item_key != self.current:
+                    self.seek_to(item_key)
                 return True
 
-    def __str__(self):
-        return self.__separator.join([action(
-            command=self.create_pipe_command(self.__get_control_command(item_key)),
-            button=Button.LEFT,
-            text=item_value
-        ) for item_key, item_value in self.items])
+    def coalesce(self, commands):
+        # Jumping to an item overrides all earlier jumps
+        coalesced = []
+        for command in commands:
+            if coalesced and coalesced[-1].startswith(':set:') and command.startswith(':set:'):
+                coalesced.pop()
+            coalesced.append(command)
+        return coalesced
+
+    def markup(self):
+        items = []
+        for item_key, item_value in self.items:
+            if items:
+                items.append(self.__separator)
+            items.append(self.create_action(self.__get_control_command(item_key), button=Button.LEFT)(item_value))
+        return items
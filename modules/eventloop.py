@@ -0,0 +1,279 @@
+import collections
+import heapq
+import itertools
+import logging
+import os
+import selectors
+import signal
+import time
+
+__all__ = ['EventLoop', 'Handle']
+
+logger = logging.getLogger(__name__)
+
+
+class Handle:
+    """
+    A callback scheduled on the event loop
+    """
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback: callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Prevents the callback from running, if it has not run yet
+        """
+        self.cancelled = True
+
+    def run(self):
+        if not self.cancelled:
+            self.callback(*self.args)
+
+
+class EventLoop:
+    """
+    A minimal selector based event loop
+
+    The loop waits on file descriptors, signals and timers together and only wakes up when one of them is due.
+    It implements the subset of the asyncio event loop interface that is used by the daemon,
+    so controls work the same whether they are driven by this loop or by an asyncio loop.
+    """
+
+    def __init__(self):
+        self.__selector = selectors.DefaultSelector()
+        self.__ready = collections.deque()
+        self.__timers = []
+        self.__sequence = itertools.count()
+        self.__signal_handlers = {}
+        self.__stopping = False
+        self.__wakeup_read, self.__wakeup_write = os.pipe()
+        os.set_blocking(self.__wakeup_read, False)
+        os.set_blocking(self.__wakeup_write, False)
+        self.__selector.register(self.__wakeup_read, selectors.EVENT_READ, (Handle(None, self.__read_wakeup, ()), None))
+
+    def time(self) -> float:
+        """
+        :return: The current time of the loop clock (monotonic, in seconds)
+        """
+        return time.monotonic()
+
+    def call_soon(self, callback: callable, *args) -> Handle:
+        """
+        Schedules a callback to run on the next iteration of the loop
+
+        :param callback: The function to call
+        :param args: Arguments to pass to the function
+        :return: Handle that can be used to cancel the call
+        """
+        handle = Handle(None, callback, args)
+        self.__ready.append(handle)
+        return handle
+
+    def call_soon_threadsafe(self, callback: callable, *args) -> Handle:
+        """
+        Schedules a callback to run on the next iteration of the loop, from any thread
+
+        :param callback: The function to call
+        :param args: Arguments to pass to the function
+        :return: Handle that can be used to cancel the call
+        """
+        handle = self.call_soon(callback, *args)
+        try:
+            os.write(self.__wakeup_write, b'\0')
+        except BlockingIOError:
+            pass  # The loop is already woken up
+        return handle
+
+    def call_at(self, when: float, callback: callable, *args) -> Handle:
+        """
+        Schedules a callback to run at a given time of the loop clock
+
+        :param when: Time to run the callback at, see time()
+        :param callback: The function to call
+        :param args: Arguments to pass to the function
+        :return: Handle that can be used to cancel the call
+        """
+        handle = Handle(when, callback, args)
+        heapq.heappush(self.__timers, (when, next(self.__sequence), handle))
+        return handle
+
+    def call_later(self, delay: float, callback: callable, *args) -> Handle:
+        """
+        Schedules a callback to run after a delay
+
+        :param delay: Delay in seconds
+        :param callback: The function to call
+        :param args: Arguments to pass to the function
+        :return: Handle that can be used to cancel the call
+        """
+        return self.call_at(self.time() + delay, callback, *args)
+
+    def add_reader(self, fd, callback: callable, *args):
+        """
+        Calls a callback every time a file descriptor becomes readable
+
+        :param fd: File descriptor or object with a fileno() method
+        :param callback: The function to call
+        :param args: Arguments to pass to the function
+        """
+        self.__watch(fd, selectors.EVENT_READ, Handle(None, callback, args))
+
+    def remove_reader(self, fd) -> bool:
+        """
+        Stops watching a file descriptor for readability
+
+        :param fd: File descriptor or object with a fileno() method
+        :return: bool Whether the file descriptor was being watched
+        """
+        return self.__unwatch(fd, selectors.EVENT_READ)
+
+    def add_writer(self, fd, callback: callable, *args):
+        """
+        Calls a callback every time a file descriptor becomes writable
+
+        :param fd: File descriptor or object with a fileno() method
+        :param callback: The function to call
+        :param args: Arguments to pass to the function
+        """
+        self.__watch(fd, selectors.EVENT_WRITE, Handle(None, callback, args))
+
+    def remove_writer(self, fd) -> bool:
+        """
+        Stops watching a file descriptor for writability
+
+        :param fd: File descriptor or object with a fileno() method
+        :return: bool Whether the file descriptor was being watched
+        """
+        return self.__unwatch(fd, selectors.EVENT_WRITE)
+
+    def __watch(self, fd, event, handle):
+        try:
+            key = self.__selector.get_key(fd)
+        except KeyError:
+            self.__selector.register(fd, event, (handle, None) if event == selectors.EVENT_READ else (None, handle))
+            return
+        reader, writer = key.data
+        if event == selectors.EVENT_READ:
+            reader = handle
+        else:
+            writer = handle
+        self.__selector.modify(fd, key.events | event, (reader, writer))
+
+    def __unwatch(self, fd, event) -> bool:
+        try:
+            key = self.__selector.get_key(fd)
+        except (KeyError, ValueError):
+            return False
+        if not key.events & event:
+            return False
+        reader, writer = key.data
+        if event == selectors.EVENT_READ:
+            reader = None
+        else:
+            writer = None
+        if key.events & ~event:
+            self.__selector.modify(fd, key.events & ~event, (reader, writer))
+        else:
+            self.__selector.unregister(fd)
+        return True
+
+    def add_signal_handler(self, sig: int, callback: callable, *args):
+        """
+        Calls a callback from the loop every time a signal is received
+
+        :param sig: The signal number
+        :param callback: The function to call
+        :param args: Arguments to pass to the function
+        """
+        if not self.__signal_handlers:
+            signal.set_wakeup_fd(self.__wakeup_write, warn_on_full_buffer=False)
+        self.__signal_handlers[sig] = Handle(None, callback, args)
+        signal.signal(sig, _noop_signal_handler)
+
+    def remove_signal_handler(self, sig: int) -> bool:
+        """
+        Removes a signal handler that was added with add_signal_handler()
+
+        :param sig: The signal number
+        :return: bool Whether a handler was removed
+        """
+        if self.__signal_handlers.pop(sig, None) is None:
+            return False
+        signal.signal(sig, signal.SIG_DFL)
+        if not self.__signal_handlers:
+            signal.set_wakeup_fd(-1)
+        return True
+
+    def __read_wakeup(self):
+        try:
+            data = os.read(self.__wakeup_read, 4096)
+        except BlockingIOError:
+            return
+        for sig in set(data):
+            if sig in self.__signal_handlers:
+                self.__ready.append(self.__signal_handlers[sig])
+
+    def run_once(self):
+        """
+        Runs one iteration of the loop
+
+        Blocks until a file descriptor is ready, a signal is received or the first timer is due,
+        then runs all callbacks that became ready.
+        """
+        while self.__timers and self.__timers[0][2].cancelled:
+            heapq.heappop(self.__timers)
+
+        if self.__ready:
+            timeout = 0
+        elif self.__timers:
+            timeout = max(0, self.__timers[0][0] - self.time())
+        else:
+            timeout = None
+
+        for key, mask in self.__selector.select(timeout):
+            reader, writer = key.data
+            if mask & selectors.EVENT_READ and reader is not None:
+                reader.run()
+            if mask & selectors.EVENT_WRITE and writer is not None:
+                writer.run()
+
+        now = self.time()
+        while self.__timers and self.__timers[0][0] <= now:
+            self.__ready.append(heapq.heappop(self.__timers)[2])
+
+        for i in range(len(self.__ready)):
+            self.__ready.popleft().run()
+
+    def run_forever(self):
+        """
+        Runs the loop until stop() is called
+        """
+        self.__stopping = False
+        while not self.__stopping:
+            self.run_once()
+
+    def stop(self):
+        """
+        Stops the loop after the current iteration
+        """
+        self.__stopping = True
+
+    def close(self):
+        """
+        Releases all resources held by the loop
+        """
+        for sig in list(self.__signal_handlers):
+            self.remove_signal_handler(sig)
+        self.__selector.close()
+        os.close(self.__wakeup_read)
+        os.close(self.__wakeup_write)
+
+
+def _noop_signal_handler(sig, frame):
+    # The signal is delivered to the loop through the wakeup fd
+    pass
@@ -0,0 +1,86 @@
+__all__ = ['ActionTemplate', 'Action', 'render', 'strip_actions']
+
+
+class ActionTemplate:
+    """
+    An xmobar action tag without its text
+
+    The opening tag is formatted once, so wrapping text in the action does not format any strings.
+    Templates are created by AbstractControl.create_action(), which keeps them until the name or the arguments of the control change.
+    """
+    __slots__ = ('command', 'button', 'open_tag')
+
+    def __init__(self, command: str, button=None):
+        """
+        :param command: The action (command to execute on click)
+        :param button: Optionally, which buttons will trigger the command (May be a Button, or a number of OR-ed buttons)
+        """
+        self.command = command
+        self.button = button
+        if button is None:
+            self.open_tag = '<action=`{}`>'.format(command)
+        else:
+            self.open_tag = '<action=`{}` button={}>'.format(command, button)
+
+    def __call__(self, text) -> 'Action':
+        """
+        :param text: The markup where the action is applied upon
+        :return: Action
+        """
+        return Action(self, text)
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (self.__class__.__name__, self.command, self.button)
+
+
+class Action:
+    """
+    Markup with an action applied upon it
+
+    Markup is a tree: a node is a str, a list of nodes or an Action around a node.
+    """
+    __slots__ = ('template', 'text')
+
+    def __init__(self, template: ActionTemplate, text):
+        """
+        :param template: The action to apply
+        :param text: The markup where the action is applied upon
+        """
+        self.template = template
+        self.text = text
+
+    def __str__(self):
+        return render(self)
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (self.__class__.__name__, self.template, self.text)
+
+
+def render(node) -> str:
+    """
+    Creates the xmobar representation of markup
+
+    :param node: The markup to render
+    :return: str
+    """
+    if isinstance(node, str):
+        return node
+    if isinstance(node, Action):
+        return node.template.open_tag + render(node.text) + '</action>'
+    return ''.join([render(child) for child in node])
+
+
+def strip_actions(node):
+    """
+    Removes all actions from markup, keeping the text they are applied upon
+
+    Text nodes are kept as they are, actions that were already rendered into a str are not removed.
+
+    :param node: The markup to remove the actions from
+    :return: The markup without any actions
+    """
+    if isinstance(node, str):
+        return node
+    if isinstance(node, Action):
+        return strip_actions(node.text)
+    return [strip_actions(child) for child in node]
@@ -0,0 +1,85 @@
+import logging
+import os
+
+__all__ = ['FrameWriter']
+
+logger = logging.getLogger(__name__)
+
+
+class FrameWriter:
+    """
+    Writes frames to an output pipe without ever blocking the daemon
+
+    Every frame is encoded once and written with a single write() call.
+    When the pipe is full, the rest of the frame is written as soon as the pipe becomes writable again.
+    Frames that are produced in the meantime replace each other, so only the most recent one is written afterwards.
+    """
+
+    def __init__(self, loop, fd: int):
+        """
+        :param loop: The event loop to wait for the pipe on
+        :param fd: File descriptor of the output pipe, it is switched to non-blocking mode and closed by close()
+        """
+        self.__loop = loop
+        self.__fd = fd
+        self.__pending = b''
+        self.__latest = None
+        self.__dropped_frames = 0
+        self.__delayed_frames = 0
+        os.set_blocking(fd, False)
+
+    @property
+    def dropped_frames(self) -> int:
+        """
+        :return: The number of frames that were never written, because a newer frame replaced them
+        """
+        return self.__dropped_frames
+
+    @property
+    def delayed_frames(self) -> int:
+        """
+        :return: The number of frames that were written later than they were produced, because the pipe was full
+        """
+        return self.__delayed_frames
+
+    def write(self, frame: str):
+        """
+        Writes a frame, or queues it when the pipe is full
+
+        :param frame: The frame, without trailing newline
+        """
+        data = (frame + '\n').encode('utf-8')
+        if self.__pending:
+            # Still busy writing an earlier frame, only the most recent frame is kept
+            if self.__latest is not None:
+                self.__dropped_frames += 1
+            self.__latest = data
+            return
+        if not self.__write(data):
+            self.__delayed_frames += 1
+            self.__loop.add_writer(self.__fd, self.__flush)
+
+    def __write(self, data: bytes) -> bool:
+        try:
+            written = os.write(self.__fd, data)
+        except BlockingIOError:
+            written = 0
+        self.__pending = data[written:]
+        return not self.__pending
+
+    def __flush(self):
+        if self.__write(self.__pending) and self.__latest is not None:
+            data, self.__latest = self.__latest, None
+            self.__delayed_frames += 1
+            self.__write(data)
+        if not self.__pending:
+            self.__loop.remove_writer(self.__fd)
+
+    def close(self):
+        """
+        Stops waiting for the pipe and closes it, frames that were not written yet are discarded
+        """
+        if self.__pending:
+            self.__loop.remove_writer(self.__fd)
+        os.close(self.__fd)
+        logger.info('Output: %d frames delayed, %d frames dropped', self.__delayed_frames, self.__dropped_frames)
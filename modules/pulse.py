@@ -0,0 +1,299 @@
+import logging
+import threading
+
+import pulsectl
+
+__all__ = ['PulseService']
+
+logger = logging.getLogger(__name__)
+
+# Facilities of the pulseaudio events that are listened to
+EVENT_FACILITIES = ('sink', 'sink_input', 'server')
+
+
+class PulseService:
+    """
+    A pulseaudio client that is shared by all audio modules
+
+    Server info, sinks and sink inputs are read from a snapshot that is fetched on first use.
+    Writes and changes reported by pulseaudio only invalidate the part of the snapshot they affect,
+    a sink that changed is fetched again on its own instead of fetching all sinks.
+    Changes are received on a dedicated connection on a background thread, listeners are notified on the event loop.
+    When no change events can be received, the snapshot is only kept for one iteration of the loop.
+    Sink inputs are moved by a background worker on another connection, one move and its reply at a time.
+    """
+
+    def __init__(self, loop, name: str = 'action-manager'):
+        """
+        :param loop: The event loop to notify listeners on
+        :param name: Client name used for the connections to pulseaudio
+        """
+        self.__loop = loop
+        self.__name = name
+        self.__pulse = None
+        self.__events = None
+        self.__event_thread = None
+        self.__stopping = False
+        self.__change_pending = False
+        self.__events_lock = threading.Lock()
+        self.__pending_events = []
+        self.__expiry_scheduled = False
+        self.__listeners = []
+        self.__server_info = None
+        self.__sinks = None
+        self.__sinks_by_index = None
+        self.__stale_sinks = set()
+        self.__sink_inputs = None
+        self.__generation = 0
+        self.__move_condition = threading.Condition()
+        self.__move_batch = None
+        self.__move_thread = None
+
+    @property
+    def generation(self) -> int:
+        """
+        :return: A number that changes every time the snapshot is invalidated,
+            values derived from the snapshot can be cached as long as it does not change
+        """
+        return self.__generation
+
+    def add_listener(self, listener: callable):
+        """
+        Registers a function that is called on the event loop when pulseaudio reported changes
+
+        The affected parts of the snapshot are already invalidated when the listener is called.
+
+        :param listener: Function that takes the set of changes, as tuples of the facility
+            ('sink', 'sink_input' or 'server') and the index of the object that changed
+        """
+        self.__listeners.append(listener)
+
+    def invalidate(self):
+        """
+        Discards the snapshot, it is fetched again on the next read
+        """
+        self.__server_info = None
+        self.__sinks = None
+        self.__sinks_by_index = None
+        self.__stale_sinks.clear()
+        self.__sink_inputs = None
+        self.__expiry_scheduled = False
+        self.__generation += 1
+
+    def __invalidate_sink(self, index: int):
+        # Sinks that were not fetched yet do not have to be fetched again
+        if self.__sinks is not None:
+            self.__stale_sinks.add(index)
+        self.__generation += 1
+
+    def __connect(self) -> pulsectl.Pulse:
+        if self.__pulse is None:
+            self.__pulse = pulsectl.Pulse(self.__name)
+            self.__events = pulsectl.Pulse(self.__name + '-events')
+            self.__event_thread = threading.Thread(target=self.__listen, name=self.__class__.__name__, daemon=True)
+            self.__event_thread.start()
+        return self.__pulse
+
+    def __fetch(self, query: callable):
+        pulse = self.__connect()
+        if not self.__event_thread.is_alive() and not self.__expiry_scheduled:
+            # Without change events, the snapshot is only valid during the current iteration of the loop
+            self.__expiry_scheduled = True
+            self.__loop.call_soon(self.invalidate)
+        return query(pulse)
+
+    def server_info(self) -> pulsectl.PulseServerInfo:
+        if self.__server_info is None:
+            self.__server_info = self.__fetch(lambda pulse: pulse.server_info())
+        return self.__server_info
+
+    def sink_list(self) -> list:
+        if self.__sinks is None:
+            self.__sinks = self.__fetch(lambda pulse: pulse.sink_list())
+            self.__sinks_by_index = None
+            self.__stale_sinks.clear()
+        elif self.__stale_sinks:
+            self.__fetch_stale_sinks()
+        return self.__sinks
+
+    def __fetch_stale_sinks(self):
+        stale, self.__stale_sinks = self.__stale_sinks, set()
+        sinks = []
+        for sink in self.__sinks:
+            if sink.index in stale:
+                try:
+                    sink = self.__fetch(lambda pulse: pulse.sink_info(sink.index))
+                except pulsectl.PulseIndexError:
+                    continue
+            sinks.append(sink)
+        self.__sinks = sinks
+        self.__sinks_by_index = None
+
+    def sink_input_list(self) -> list:
+        if self.__sink_inputs is None:
+            self.__sink_inputs = self.__fetch(lambda pulse: pulse.sink_input_list())
+        return self.__sink_inputs
+
+    def sink_info(self, index: int) -> pulsectl.PulseSinkInfo:
+        sinks = self.sink_list()
+        if self.__sinks_by_index is None:
+            self.__sinks_by_index = {sink.index: sink for sink in sinks}
+        try:
+            return self.__sinks_by_index[index]
+        except KeyError:
+            raise pulsectl.PulseIndexError(index)
+
+    def default_sink(self):
+        """
+        :return: The default sink, or None when pulseaudio has no default sink
+        """
+        default_sink_name = self.server_info().default_sink_name
+        return next(filter(lambda sink: sink.name == default_sink_name, self.sink_list()), None)
+
+    def sink_default_set(self, name: str):
+        self.__connect().sink_default_set(name)
+        self.__server_info = None
+        self.__generation += 1
+
+    def sink_input_move(self, index: int, sink_index: int):
+        self.__connect().sink_input_move(index, sink_index)
+        self.__sink_inputs = None
+        self.__generation += 1
+
+    def sink_input_move_all(self, indices: list, sink_index: int, on_done: callable = None):
+        """
+        Moves sink inputs to a sink in the background
+
+        The moves are made one after the other on a separate connection, each waiting for its own reply,
+        so they are not pipelined, but the event loop never waits for pulseaudio.
+        A batch that did not start yet is replaced by a newer batch, only the most recent target sink matters.
+
+        :param indices: Indices of the sink inputs to move
+        :param sink_index: Index of the sink to move them to
+        :param on_done: Called on the event loop with the indices of the sink inputs that could not be moved
+        """
+        with self.__move_condition:
+            self.__move_batch = (list(indices), sink_index, on_done)
+            self.__move_condition.notify()
+        if self.__move_thread is None:
+            self.__move_thread = threading.Thread(target=self.__move_sink_inputs, name=self.__class__.__name__ + '-moves', daemon=True)
+            self.__move_thread.start()
+
+    def __move_sink_inputs(self):
+        """
+        Runs on the move thread, until close() is called
+        """
+        try:
+            with pulsectl.Pulse(self.__name + '-moves') as pulse:
+                while True:
+                    with self.__move_condition:
+                        while self.__move_batch is None and not self.__stopping:
+                            self.__move_condition.wait()
+                        if self.__stopping:
+                            return
+                        (indices, sink_index, on_done), self.__move_batch = self.__move_batch, None
+                    failed = _move_sink_inputs(pulse, indices, sink_index)
+                    self.__loop.call_soon_threadsafe(self.__sink_inputs_moved, failed, on_done)
+        except pulsectl.PulseError:
+            logger.exception('%s: Stopped moving sink inputs', self.__class__.__name__)
+
+    def __sink_inputs_moved(self, failed: list, on_done: callable):
+        self.__sink_inputs = None
+        self.__generation += 1
+        if on_done is not None:
+            on_done(failed)
+
+    def sink_mute(self, index: int, mute: bool):
+        self.__connect().sink_mute(index, mute)
+        self.__invalidate_sink(index)
+
+    def sink_volume_set(self, index: int, volume: pulsectl.PulseVolumeInfo):
+        self.__connect().sink_volume_set(index, volume)
+        self.__invalidate_sink(index)
+
+    def __on_event(self, event):
+        # No pulse operations are allowed here, the event is queued, the listener is stopped and the loop is notified instead
+        facility = next((name for name in EVENT_FACILITIES if event.facility == name), None)
+        if facility is not None:
+            with self.__events_lock:
+                self.__pending_events.append((facility, event.t == 'change', event.index))
+        raise pulsectl.PulseLoopStop
+
+    def __listen(self):
+        """
+        Runs on the event thread, until close() is called
+        """
+        pulse = self.__events
+        try:
+            pulse.event_mask_set('sink', 'sink_input', 'server')
+            pulse.event_callback_set(self.__on_event)
+            while not self.__stopping:
+                pulse.event_listen()
+                with self.__events_lock:
+                    # Events that arrive before the loop handled the earlier ones are handled together with them
+                    notify = not self.__stopping and not self.__change_pending
+                    self.__change_pending = True
+                if notify:
+                    self.__loop.call_soon_threadsafe(self.__changed)
+        except pulsectl.PulseError:
+            if not self.__stopping:
+                logger.exception('%s: Stopped listening for pulseaudio events', self.__class__.__name__)
+
+    def __changed(self):
+        with self.__events_lock:
+            events, self.__pending_events = self.__pending_events, []
+            self.__change_pending = False
+        if not events:
+            return
+        changes = set()
+        for facility, changed, index in events:
+            changes.add((facility, index))
+            if facility == 'server':
+                self.__server_info = None
+            elif facility == 'sink_input':
+                self.__sink_inputs = None
+            elif changed:
+                self.__invalidate_sink(index)
+            else:
+                # A sink was added or removed
+                self.__sinks = None
+                self.__sinks_by_index = None
+        self.__generation += 1
+        for listener in self.__listeners:
+            try:
+                listener(changes)
+            except Exception:
+                logger.exception('%s: Listener %r failed', self.__class__.__name__, listener)
+
+    def close(self):
+        """
+        Stops listening for changes and closes the connections
+        """
+        if self.__pulse is None:
+            return
+        self.__stopping = True
+        if self.__move_thread is not None:
+            with self.__move_condition:
+                self.__move_condition.notify()
+            self.__move_thread.join()
+        while self.__event_thread.is_alive():
+            # event_listen_stop() does nothing when the listener is not waiting yet, so it is repeated
+            self.__events.event_listen_stop()
+            self.__event_thread.join(0.1)
+        self.__events.close()
+        self.__pulse.close()
+
+
+def _move_sink_inputs(pulse: pulsectl.Pulse, indices: list, sink_index: int) -> list:
+    """
+    Moves sink inputs one at a time, only the public pulsectl API is used
+
+    :return: Indices of the sink inputs that could not be moved
+    """
+    failed = []
+    for index in indices:
+        try:
+            pulse.sink_input_move(index, sink_index)
+        except pulsectl.PulseOperationFailed:
+            failed.append(index)
+    return failed
@@ -1,13 +1,17 @@
 import subprocess
 import logging
 
-from .core import AbstractControl, action
+from .core import AbstractControl
 
 logger = logging.getLogger(__name__)
 
 __all__ = ['RedshiftControl']
 
 class RedshiftControl(AbstractControl):
+    # The redshift process is watched by the supervisor, there is nothing to poll
+    periodic_interval = None
+    plain_commands = frozenset()
+
     def __init__(self):
         super().__init__()
         self._redshift_proc = None
@@ -17,9 +21,9 @@ class RedshiftControl(AbstractControl):
         argument_parser.add_argument('--redshift-temperature',
                                      help='DAY:NIGHT Color temperature to set at daytime/night', type=str)
 
-    def bind_arguments(self, args):
-        super().bind_arguments(args)
-        if self.enabled and not self.redshift_error_message:
+    def bind_runtime(self, runtime):
+        super().bind_runtime(runtime)
+        if not self.redshift_error_message:
             self.redshift_enabled = True
 
     @property
@@ -41,18 +45,17 @@ class RedshiftControl(AbstractControl):
             return
         if value:
             logger.info("Starting redshift: -l %s -t %s", self.args.redshift_location, self.args.redshift_temperature)
-            self._redshift_proc = subprocess.Popen(
-                ['redshift', '-l', self.args.redshift_location, '-t', self.args.redshift_temperature], stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+            self._redshift_proc = self.runtime.supervisor.spawn(
+                ['redshift', '-l', self.args.redshift_location, '-t', self.args.redshift_temperature],
+                on_exit=self.__redshift_exited, stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT)
         else:
             logger.info("Terminating running redshift process")
             self._redshift_proc.terminate()
 
-    def periodic(self):
-        if self._redshift_proc:
-            self._redshift_proc.poll()
-            if self._redshift_proc.returncode is not None:
-                self._redshift_proc = None
-                return True
+    def __redshift_exited(self, process):
+        if self._redshift_proc is process:
+            self._redshift_proc = None
+            self.invalidate()
 
     def respond_to(self, command):
         if command == ':redshift':
@@ -65,9 +68,9 @@ class RedshiftControl(AbstractControl):
         if self._redshift_proc:
             self._redshift_proc.wait()
 
-    def __str__(self):
+    def markup(self):
         if not self.redshift_error_message:
-            return action(self.create_pipe_command(':redshift'), 'R' if self.redshift_enabled else 'r')
+            return self.create_action(':redshift')('R' if self.redshift_enabled else 'r')
         return 'E: ' + self.redshift_error_message
 
     def load_state(self, state):
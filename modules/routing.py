@@ -0,0 +1,190 @@
+import logging
+
+__all__ = ['CommandRouter']
+
+logger = logging.getLogger(__name__)
+
+# Resolved commands are cached, the cache is reset when it grows beyond this number of distinct commands
+CACHE_SIZE = 4096
+
+
+class CommandRouter:
+    """
+    Dispatches commands straight to the controls that handle them
+
+    Namespaced commands are resolved to the control with the longest namespace that prefixes the command.
+    Plain commands are resolved through the commands that controls declare in plain_commands and plain_command_prefixes,
+    controls that do not declare their plain commands receive all plain commands.
+    Resolved commands are cached, so dispatching a command that was seen before is a single lookup.
+
+    When a batch of commands is dispatched, consecutive commands for the same controls are passed through
+    the coalesce() method of those controls first, so runs of commands are applied as their net effect.
+    """
+
+    def __init__(self):
+        self.__namespaces = {}
+        self.__plain = {}
+        self.__plain_prefixes = []
+        self.__broadcast = []
+        self.__cache = {}
+
+    def add_namespace(self, name: str, control):
+        """
+        Routes namespaced commands that start with a namespace to a control
+
+        :param name: The full namespace of the control
+        :param control: The control that handles the commands
+        """
+        self.__namespaces[name] = control
+        self.__cache.clear()
+
+    def add_plain_commands(self, control, commands, prefixes=()):
+        """
+        Routes plain commands to a control
+
+        :param control: The control that handles the commands
+        :param commands: Commands handled by the control, or None when the control receives all plain commands
+        :param prefixes: Prefixes of parameterized commands handled by the control
+        """
+        if commands is None:
+            self.__broadcast.append(control)
+        else:
+            for command in commands:
+                self.__plain.setdefault(command, []).append(control)
+            self.__plain_prefixes.extend((prefix, control) for prefix in prefixes)
+        self.__cache.clear()
+
+    def resolve(self, command: str):
+        """
+        :param command: The command received from the user
+        :return: list of tuples of a control and the command to pass to its respond_to()
+        """
+        try:
+            return self.__cache[command]
+        except KeyError:
+            pass
+        if command[0] == ':':
+            targets = self.__resolve_namespaced(command)
+        else:
+            targets = self.__resolve_plain(command)
+        if len(self.__cache) >= CACHE_SIZE:
+            self.__cache.clear()
+        self.__cache[command] = targets
+        return targets
+
+    def __resolve_namespaced(self, command):
+        end = len(command)
+        while True:
+            end = command.rfind(':', 0, end)
+            if end <= 0:
+                logger.error('No module handles command %s', command)
+                return []
+            control = self.__namespaces.get(command[:end])
+            if control is not None:
+                return [(control, command[end:])]
+
+    def __resolve_plain(self, command):
+        controls = list(self.__plain.get(command, ()))
+        controls += [control for prefix, control in self.__plain_prefixes if command.startswith(prefix)]
+        controls += self.__broadcast
+        return [(control, command) for control in controls]
+
+    def dispatch(self, command: str) -> bool:
+        """
+        Passes a command to the controls that handle it
+
+        :param command: The command received from the user
+        :return: bool Whether the displayed information is changed by the command
+        """
+        changed = False
+        for control, control_command in self.resolve(command):
+            if control.enabled and control.respond_to(control_command):
+                control.invalidate()
+                changed = True
+        return changed
+
+    async def dispatch_async(self, command: str) -> bool:
+        """
+        Coroutine version of dispatch(), using respond_to_async()
+
+        :param command: The command received from the user
+        :return: bool Whether the displayed information is changed by the command
+        """
+        import asyncio
+        targets = [(control, control_command) for control, control_command in self.resolve(command) if control.enabled]
+        results = await asyncio.gather(*[control.respond_to_async(control_command) for control, control_command in targets])
+        changed = False
+        for (control, _), result in zip(targets, results):
+            if result:
+                control.invalidate()
+                changed = True
+        return changed
+
+    def __runs(self, commands):
+        """
+        Splits a batch of commands in runs of consecutive commands that are routed to the same controls
+
+        :return: Iterator over tuples of the indices of the commands in the run, and a list of tuples of a control
+            and the commands of the run to pass to it
+        """
+        resolved = [self.resolve(command) for command in commands]
+        start = 0
+        while start < len(commands):
+            controls = [control for control, _ in resolved[start]]
+            end = start + 1
+            while end < len(commands) and [control for control, _ in resolved[end]] == controls:
+                end += 1
+            indices = range(start, end)
+            yield indices, [(control, [resolved[i][n][1] for i in indices]) for n, control in enumerate(controls)]
+            start = end
+
+    @staticmethod
+    def __coalesce(control, commands):
+        if len(commands) == 1:
+            return commands
+        coalesced = control.coalesce(commands)
+        if len(coalesced) != len(commands):
+            logger.debug('%s.coalesce: %r -> %r', control.__class__.__name__, commands, coalesced)
+        return coalesced
+
+    def dispatch_all(self, commands: list) -> list:
+        """
+        Passes a batch of commands to the controls that handle them, coalescing runs of commands
+
+        :param commands: The commands received from the user, in order
+        :return: list of bools, whether the displayed information is changed by each command
+        """
+        results = [False] * len(commands)
+        for indices, targets in self.__runs(commands):
+            for control, control_commands in targets:
+                if not control.enabled:
+                    continue
+                changed = False
+                for control_command in self.__coalesce(control, control_commands):
+                    changed = control.respond_to(control_command) or changed
+                if changed:
+                    control.invalidate()
+                    for i in indices:
+                        results[i] = True
+        return results
+
+    async def dispatch_all_async(self, commands: list) -> list:
+        """
+        Coroutine version of dispatch_all(), using respond_to_async()
+
+        :param commands: The commands received from the user, in order
+        :return: list of bools, whether the displayed information is changed by each command
+        """
+        results = [False] * len(commands)
+        for indices, targets in self.__runs(commands):
+            for control, control_commands in targets:
+                if not control.enabled:
+                    continue
+                changed = False
+                for control_command in self.__coalesce(control, control_commands):
+                    changed = await control.respond_to_async(control_command) or changed
+                if changed:
+                    control.invalidate()
+                    for i in indices:
+                        results[i] = True
+        return results
@@ -0,0 +1,39 @@
+__all__ = ['Runtime']
+
+
+class Runtime:
+    """
+    Services of the running daemon that are shared by all modules
+
+    Services that need a backend are only created the first time a module uses them.
+    """
+
+    def __init__(self, loop, scheduler, supervisor, pulse=None):
+        """
+        :param loop: The event loop the daemon runs on (an EventLoop or an asyncio event loop)
+        :param scheduler: The scheduler that calls periodic() on modules
+        :param supervisor: The ProcessSupervisor that spawns child processes for modules
+        :param pulse: A function that creates the PulseService shared by audio modules, or None when pulsectl is not available
+        """
+        self.loop = loop
+        self.scheduler = scheduler
+        self.supervisor = supervisor
+        self.__create_pulse = pulse
+        self.__pulse = None
+
+    @property
+    def pulse(self):
+        """
+        :return: The PulseService shared by audio modules, or None when pulsectl is not available
+        """
+        if self.__pulse is None and self.__create_pulse is not None:
+            self.__pulse = self.__create_pulse()
+        return self.__pulse
+
+    def close(self):
+        """
+        Stops the services, services that were never used are not created
+        """
+        self.supervisor.close()
+        if self.__pulse is not None:
+            self.__pulse.close()
@@ -0,0 +1,156 @@
+import heapq
+import itertools
+import logging
+import time
+
+__all__ = ['Scheduler']
+
+logger = logging.getLogger(__name__)
+
+# Controls that are due within this many seconds of each other run on the same wakeup
+RESOLUTION = 0.005
+
+
+class Scheduler:
+    """
+    Calls periodic() on every scheduled control at the rate the control asks for
+
+    Deadlines are kept on the monotonic clock of the event loop, in a heap ordered by deadline.
+    Only one loop timer is armed at any time, for the earliest deadline, so controls that are due
+    at the same moment share a single wakeup and nothing runs while no control is due.
+    """
+
+    def __init__(self, loop, on_change: callable, run_async: bool = False):
+        """
+        :param loop: The event loop to schedule timers on
+        :param on_change: Called when a periodic() call reports that the displayed information changed
+        :param run_async: Use periodic_async() coroutines instead of periodic()
+        """
+        self.__loop = loop
+        self.__on_change = on_change
+        self.__run_async = run_async
+        self.__heap = []
+        self.__entries = {}
+        self.__sequence = itertools.count()
+        self.__timer = None
+        self.__timer_deadline = None
+
+    def add(self, control):
+        """
+        Starts calling periodic() on a control
+
+        The first call happens as soon as possible, or on the next wall-clock boundary for aligned controls.
+        :param control: The control to schedule
+        """
+        self.__push(control, self.__first_deadline(control))
+
+    def remove(self, control):
+        """
+        Stops calling periodic() on a control
+
+        From within its own periodic(), a control stops itself by setting its periodic_interval to None instead.
+        """
+        self.__entries.pop(control, None)
+
+    def run_now(self, control):
+        """
+        Calls periodic() on a control right away, without affecting its schedule
+        """
+        self.__call(control, reschedule=False)
+
+    def __first_deadline(self, control):
+        now = self.__loop.time()
+        if control.periodic_align:
+            return now + self.__until_boundary(control.periodic_interval)
+        return now
+
+    @staticmethod
+    def __until_boundary(interval):
+        return interval - time.time() % interval
+
+    def __next_deadline(self, control, deadline):
+        interval = control.periodic_interval
+        if interval is None:
+            return None
+        now = self.__loop.time()
+        if control.periodic_align:
+            until_boundary = self.__until_boundary(interval)
+            if until_boundary <= RESOLUTION:
+                # Controls run up to RESOLUTION early, the boundary they just ran for is skipped
+                until_boundary += interval
+            return now + until_boundary
+        deadline += interval
+        if deadline <= now:
+            # Skip ticks that were missed instead of running them all at once
+            deadline = now + interval
+        return deadline
+
+    def __push(self, control, deadline):
+        entry = (deadline, next(self.__sequence), control)
+        self.__entries[control] = entry
+        heapq.heappush(self.__heap, entry)
+        self.__arm()
+
+    def __arm(self):
+        while self.__heap and self.__entries.get(self.__heap[0][2]) is not self.__heap[0]:
+            heapq.heappop(self.__heap)  # Removed or rescheduled control
+        if not self.__heap:
+            return
+        deadline = self.__heap[0][0]
+        if self.__timer is not None:
+            if self.__timer_deadline <= deadline:
+                return
+            self.__timer.cancel()
+        self.__timer = self.__loop.call_at(deadline, self.__fire)
+        self.__timer_deadline = deadline
+
+    def __fire(self):
+        self.__timer = None
+        now = self.__loop.time() + RESOLUTION
+        due = []
+        while self.__heap and self.__heap[0][0] <= now:
+            entry = heapq.heappop(self.__heap)
+            if self.__entries.get(entry[2]) is entry:
+                del self.__entries[entry[2]]
+                due.append(entry)
+        changed = False
+        for deadline, _, control in due:
+            changed = self.__call(control, deadline=deadline, notify=False) or changed
+        if changed:
+            self.__on_change()
+        self.__arm()
+
+    def __call(self, control, deadline=None, reschedule=True, notify=True):
+        if self.__run_async and control.enabled:
+            task = self.__loop.create_task(control.periodic_async())
+            task.add_done_callback(lambda t: self.__completed(t, control, deadline, reschedule))
+            return False
+        changed = False
+        if control.enabled:
+            logger.debug('%s.periodic()', control.__class__.__name__)
+            changed = bool(control.periodic())
+            if changed:
+                control.invalidate()
+        if reschedule:
+            self.__reschedule(control, deadline)
+        if changed and notify:
+            self.__on_change()
+        return changed
+
+    def __completed(self, task, control, deadline, reschedule):
+        if reschedule:
+            self.__reschedule(control, deadline)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error('%s.periodic_async() failed', control.__class__.__name__, exc_info=task.exception())
+        elif task.result():
+            control.invalidate()
+            self.__on_change()
+
+    def __reschedule(self, control, deadline):
+        if control in self.__entries:
+            return  # Rescheduled by the control itself
+        deadline = self.__next_deadline(control, deadline)
+        if deadline is not None:
+            self.__push(control, deadline)
@@ -1,64 +1,131 @@
-from collections import OrderedDict
-from .cycle import OrderedDictCycleAction, CycleControl
-from .core import WrappingControl, action
-from .util import process_reaper
+from .cycle import OrderedDictCycleAction, CycleControl, CycleRing
+from .core import WrappingControl
+from .markup import strip_actions
+from .util import module_available
 import logging
 import os
 import stat
-import subprocess
 import argparse
-try:
-    import tkinter
-except ImportError:
-    tkinter = None
 import math
 import threading
-import re
+from functools import partial
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
 MAX_ITEMS_BEFORE_POPUP=3
+# Shown instead of the layout name while a layout is being applied
+SWITCHING_FORMAT='~{}'
 
-try:
-    import pyinotify
-    logger.info('Inotify support enabled')
-    class InotifyEventHandler(pyinotify.ProcessEvent):
-        def my_init(self, action: callable):
-            self.__action = action
-
-        def process_default(self, event):
-            logger.debug('Inotify received event.')
-            self.__action()
-
-    class Inotify:
-        def __init__(self, directory, action):
-            self.__directory = directory
-            self.__wm = pyinotify.WatchManager()
-            self.__notifier = pyinotify.ThreadedNotifier(self.__wm, default_proc_fun=InotifyEventHandler(action=action))
-            self.__wd = None
-
-        def start(self):
-            self.__notifier.start()
-            self.__wd = self.__wm.add_watch(self.__directory, pyinotify.IN_DELETE|pyinotify.IN_CREATE)[self.__directory]
-            logger.debug('Added inotify watcher for %s', self.__directory)
-
-        def stop(self):
-            self.__wm.del_watch(self.__wd)
+# Changes to the layout directory are collected for this number of seconds after the first one, and applied together
+WATCH_DEBOUNCE = 0.2
+# Seconds between two checks of the layout directory when inotify is not available
+WATCH_POLL_INTERVAL = 5
+
+
+class DirectoryWatch:
+    """
+    Reports the names of files in a directory that were created, deleted, modified or changed mode
+
+    The inotify file descriptor is read by the event loop itself, so no thread is needed.
+    When pyinotify is not available, the modification time of the directory is polled instead,
+    which only notices files that are created, deleted or renamed.
+    """
+
+    def __init__(self, loop, directory: str, action: callable):
+        """
+        :param loop: The event loop to watch the directory on
+        :param directory: The directory to watch
+        :param action: Called on the event loop with the set of names of the files that changed
+        """
+        self.__loop = loop
+        self.__directory = directory
+        self.__action = action
+        self.__pending = set()
+        self.__flush_handle = None
+        self.__notifier = None
+        self.__fd = None
+        self.__poll_handle = None
+        self.__mtime = None
+        self.__names = None
+
+    def start(self):
+        if module_available('pyinotify'):
+            self.__start_inotify()
+        else:
+            logger.warning('pyinotify is not available, polling %s for changes', self.__directory)
+            self.__start_polling()
+
+    def __start_inotify(self):
+        import pyinotify
+        wm = pyinotify.WatchManager()
+        self.__notifier = pyinotify.Notifier(wm, default_proc_fun=self.__process_event)
+        wm.add_watch(self.__directory, pyinotify.IN_CREATE | pyinotify.IN_DELETE | pyinotify.IN_MODIFY |
+                     pyinotify.IN_ATTRIB | pyinotify.IN_MOVED_FROM | pyinotify.IN_MOVED_TO)
+        self.__fd = wm.get_fd()
+        self.__loop.add_reader(self.__fd, self.__read_events)
+        logger.debug('Added inotify watcher for %s', self.__directory)
+
+    def __read_events(self):
+        self.__notifier.read_events()
+        self.__notifier.process_events()
+
+    def __process_event(self, event):
+        logger.debug('Inotify received %s for %s', event.maskname, event.pathname)
+        if event.name:
+            self.__changed(event.name)
+
+    def __start_polling(self):
+        try:
+            self.__mtime = os.stat(self.__directory).st_mtime_ns
+            self.__names = set(os.listdir(self.__directory))
+        except OSError:
+            logger.exception('Could not read %s', self.__directory)
+        self.__poll_handle = self.__loop.call_later(WATCH_POLL_INTERVAL, self.__poll)
+
+    def __poll(self):
+        try:
+            mtime = os.stat(self.__directory).st_mtime_ns
+            if mtime != self.__mtime:
+                names = set(os.listdir(self.__directory))
+                for name in names.symmetric_difference(self.__names or ()):
+                    self.__changed(name)
+                self.__mtime = mtime
+                self.__names = names
+        except OSError:
+            logger.exception('Could not read %s', self.__directory)
+        self.__poll_handle = self.__loop.call_later(WATCH_POLL_INTERVAL, self.__poll)
+
+    def __changed(self, name: str):
+        self.__pending.add(name)
+        if self.__flush_handle is None:
+            self.__flush_handle = self.__loop.call_later(WATCH_DEBOUNCE, self.__flush)
+
+    def __flush(self):
+        self.__flush_handle = None
+        names, self.__pending = self.__pending, set()
+        self.__action(names)
+
+    def stop(self):
+        if self.__flush_handle is not None:
+            self.__flush_handle.cancel()
+        if self.__poll_handle is not None:
+            self.__poll_handle.cancel()
+        if self.__notifier is not None:
+            self.__loop.remove_reader(self.__fd)
             self.__notifier.stop()
             logger.debug('Removed inotify watcher for %s', self.__directory)
 
-except ImportError:
-    logger.warn('pyinotify is not available, inotify support disabled')
-    class Inotify:
-        def __init__(self, *a, **k):
-            pass
-
-        def start(self):
-            pass
 
-        def stop(self):
-            pass
+def _is_layout(path: str) -> bool:
+    """
+    :return: Whether the path is an executable file
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return False
+    return stat.S_ISREG(mode) and bool(mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH))
 
 
 class ScreenLayoutAction(WrappingControl):
@@ -66,29 +133,34 @@ class ScreenLayoutAction(WrappingControl):
         self.__screen_layout_cycle = ScreenLayoutCycleAction(*a, **k)
         super().__init__(CycleControl(self.__screen_layout_cycle, scroll_actions=False))
  
-    def __str__(self):
-        parent = super().__str__()
-        if tkinter is not None and len(self.__screen_layout_cycle) > MAX_ITEMS_BEFORE_POPUP:
-            parent = re.sub(r'(?:<action=`[^`]+`(?: button=\d)?>)+([^<>]*)(?:<\/action>)+', r'\1', parent) # Clear all action tags
-            parent = action(
-                self.create_pipe_command('screenlayout'),
-                parent
-            )
- 
-        return parent
+    def markup(self):
+        if module_available('tkinter') and len(self.__screen_layout_cycle) > MAX_ITEMS_BEFORE_POPUP:
+            # The popup replaces the actions of the cycler
+            return self.create_action('screenlayout')(strip_actions(self.child.markup()))
+        return self.child.render()
 
 class ScreenLayoutCycleAction(OrderedDictCycleAction):
+    # Only the first call is needed, to apply the initial layout
+    periodic_interval = 0
+    plain_commands = frozenset({'screenlayout', 'screenlayout-reset'})
+
     def __init__(self, name: callable):
-        self.__od = OrderedDict()
-        super().__init__(self.__od)
+        self.__layouts = CycleRing()
+        super().__init__(self.__layouts)
         self.__inhibited = True
         self.__naming_func = name
         self.__default_layout = None
-        self.__inotify = None
+        self.__watch = None
+        self.__applied = None
+        self.__switching = None
+        self.__timeout_handle = None
+        self.__queued = None
 
     def configure(self, argument_parser: argparse.ArgumentParser):
         argument_parser.add_argument('--screenlayout-dir', help='Directory containing screenlayout shell files.', type=str)
         argument_parser.add_argument('--screenlayout-default', help='Default screenlayout shell file basename', type=str)
+        argument_parser.add_argument('--screenlayout-timeout', help='Time a screenlayout shell file may take before it is considered failed (in seconds)',
+                                     type=float, default=10)
 
     @property
     def enabled(self):
@@ -97,8 +169,6 @@ class ScreenLayoutCycleAction(OrderedDictCycleAction):
     def bind_arguments(self, args):
         super().bind_arguments(args)
         self.__load_layouts(args.screenlayout_dir)
-        self.__inotify = Inotify(args.screenlayout_dir, lambda: self.__load_layouts(args.screenlayout_dir))
-        self.__inotify.start()
         if args.screenlayout_default:
             layout_dir = Path(args.screenlayout_dir)
             layout_default = layout_dir / args.screenlayout_default
@@ -107,31 +177,51 @@ class ScreenLayoutCycleAction(OrderedDictCycleAction):
             else:
                 self.__default_layout = str(layout_default)
 
+    def bind_runtime(self, runtime):
+        super().bind_runtime(runtime)
+        self.__watch = DirectoryWatch(runtime.loop, self.args.screenlayout_dir, self.__layouts_changed)
+        self.__watch.start()
+
     def cleanup(self):
-        if self.__inotify:
-            self.__inotify.stop()
+        if self.__watch:
+            self.__watch.stop()
 
     def next(self):
         super().next()
         logger.info("Setting screen layout to %s", self.current)
-        self.__set_screen_layout(next_layout=self.next, item=self.current)
+        self.__set_screen_layout(self.__fallback_order(1))
     
     def prev(self):
         super().prev()
         logger.info("Setting screen layout to %s", self.current)
-        self.__set_screen_layout(next_layout=self.prev, item=self.current)
+        self.__set_screen_layout(self.__fallback_order(-1))
+
+    def seek(self, offset: int):
+        # Only the layout that is reached is applied
+        super().seek(offset)
+        logger.info("Setting screen layout to %s", self.current)
+        self.__set_screen_layout(self.__fallback_order(1 if offset > 0 else -1))
+
+    def seek_to(self, key) -> bool:
+        # Only the layout that is jumped to is applied
+        if not super().seek_to(key):
+            return False
+        logger.info("Setting screen layout to %s", self.current)
+        self.__set_screen_layout(self.__fallback_order(1))
+        return True
     
     def periodic(self):
+        self.periodic_interval = None
         if self.__inhibited:
             self.__inhibited = False
-            self.__set_screen_layout(next_layout=self.next, item=self.current)
+            self.__set_screen_layout(self.__fallback_order(1))
             return True
         return False
 
     def respond_to(self, command: str):
         if command == 'screenlayout':
-            if tkinter is not None and len(self) > MAX_ITEMS_BEFORE_POPUP:
-                threading.Thread(target=self.__create_tk()).start()
+            if module_available('tkinter') and len(self) > MAX_ITEMS_BEFORE_POPUP:
+                threading.Thread(target=self.__create_tk).start()
             else:
                 self.next()
             return True
@@ -140,43 +230,109 @@ class ScreenLayoutCycleAction(OrderedDictCycleAction):
                 logger.error('Default layout is not set. Cannot reset layout')
                 return False
             self.__inhibited = False
-            self.__set_screen_layout(next_layout=None, item=self.__default_layout)
+            self.__set_screen_layout([self.__default_layout])
             return True
         else:
             return super().respond_to(command)
 
     def __str__(self):
+        if self.__switching is not None:
+            return SWITCHING_FORMAT.format(self.__naming_func(super().__str__()))
         return self.__naming_func(super().__str__())
 
+    def __layouts_changed(self, names: set):
+        """
+        Adds or removes only the layouts that changed, the current layout stays selected
+        """
+        for name in names:
+            path = os.path.join(self.args.screenlayout_dir, name)
+            if _is_layout(path):
+                if path not in self.__layouts:
+                    logger.debug('Found file %s', path)
+                    self.__layouts[path] = name
+            elif path in self.__layouts:
+                logger.debug('Removed file %s', path)
+                del self.__layouts[path]
+        self.invalidate()
+
     def __load_layouts(self, directory):
-        self.__od.clear()
+        self.__layouts.clear()
         entries = os.scandir(directory)
         for entry in entries:
             if entry.is_file():
                 mode = entry.stat().st_mode
                 if mode & stat.S_IXUSR or mode & stat.S_IXGRP or mode & stat.S_IXOTH:
                     logger.debug('Found file %s', entry.path)
-                    self.__od[entry.path] = entry.name
+                    self.__layouts[entry.path] = entry.name
+
+    def __fallback_order(self, direction: int) -> list:
+        """
+        :param direction: 1 to fall back to the next layouts, -1 to fall back to the previous layouts
+        :return: All layouts, starting from the current one, in the order they are tried when a layout fails
+        """
+        keys = self.__layouts.rotated()
+        return keys[:1] + (keys[1:] if direction > 0 else keys[:0:-1])
+
+    def __set_screen_layout(self, candidates: list):
+        """
+        Applies the first layout of the candidates that succeeds, in the background
+
+        Every candidate is tried at most once. When a layout is already being applied, the candidates are
+        queued instead, replacing any candidates that were queued earlier.
 
-    def __set_screen_layout(self, next_layout, item):
+        :param candidates: Layouts to try, in order
+        """
         if self.__inhibited:
             logger.info('Screen layout is inhibited.')
             return
-        logger.info('Starting screenlayout %s', item)
-        try:
-            layout_proc = subprocess.Popen([item])
-            self.current = item
-            if layout_proc.wait():
-                if next_layout:
-                    logger.warning('Screenlayout failed, continueing to next layout.')
-                    next_layout()
-        except Exception:
-            if next_layout:
-                logger.exception('Screenlayout failed. Continueing to next layout')
-                next_layout()
+        if self.__switching is not None:
+            logger.info('Screenlayout %s is still being applied, queueing %s', self.__switching, candidates[:1])
+            self.__queued = candidates
+            return
+        self.__try_screen_layout(candidates)
+
+    def __try_screen_layout(self, candidates: list):
+        for i, item in enumerate(candidates):
+            logger.info('Starting screenlayout %s', item)
+            try:
+                process = self.runtime.supervisor.spawn([item], on_exit=partial(self.__screen_layout_exited, item, candidates[i + 1:]))
+            except Exception:
+                logger.exception('Screenlayout %s failed. Continueing to next layout', item)
+                continue
+            self.__switching = item
+            if item in self.__layouts:
+                self.current = item
+            self.__timeout_handle = self.runtime.loop.call_later(self.args.screenlayout_timeout, self.__screen_layout_timed_out, process)
+            self.invalidate()
+            return
+        logger.error('No screenlayout could be applied, keeping %s', self.__applied)
+        if self.__applied in self.__layouts:
+            self.current = self.__applied
+        self.invalidate()
+
+    def __screen_layout_timed_out(self, process):
+        logger.warning('Screenlayout %s did not finish within %s seconds, killing it', process.args[0], self.args.screenlayout_timeout)
+        process.kill()
+
+    def __screen_layout_exited(self, item, candidates, process):
+        self.__timeout_handle.cancel()
+        self.__switching = None
+        queued, self.__queued = self.__queued, None
+        if process.returncode == 0:
+            self.__applied = item
+            self.invalidate()
+        elif queued is None:
+            logger.warning('Screenlayout %s failed, continueing to next layout.', item)
+            self.__try_screen_layout(candidates)
+        else:
+            logger.warning('Screenlayout %s failed.', item)
+        if queued is not None:
+            # Requests made while switching supersede the remaining fallbacks
+            self.__try_screen_layout(queued)
 
     def __create_tk(self):
-        options = list(self.__od.keys())[1:] # Skip the first option, it is the current one
+        import tkinter
+        options = self.__layouts.rotated()[1:] # Skip the first option, it is the current one
         num_options = len(options)
         cols=math.ceil(math.sqrt(num_options))
         rows = math.ceil(num_options / cols)
@@ -192,12 +348,14 @@ class ScreenLayoutCycleAction(OrderedDictCycleAction):
         logger.debug("geometry: width=%d, height=%d, x=%d, y=%d", width, height, x, y)
         root.geometry('{}x{}+{}+{}'.format(width, height, x, y))
         def create_callback(item):
-            def cb():
+            def set_layout():
                 self.__inhibited = False
-                current = self.current
-                def restore_current():
-                    self.__set_screen_layout(None, current)
-                self.__set_screen_layout(restore_current, item)
+                # Falls back to the current layout when the chosen one fails
+                self.__set_screen_layout([item, self.current])
+
+            def cb():
+                # Tk runs on its own thread, the layout is changed on the event loop
+                self.runtime.loop.call_soon_threadsafe(set_layout)
                 root.destroy()
             return cb
 
@@ -211,5 +369,5 @@ class ScreenLayoutCycleAction(OrderedDictCycleAction):
                         relwidth=1.0 / cols,
                         relheight=1.0 / rows,
                     )
-                    button = tkinter.Button(root, text=self.__naming_func(self.__od[item]), command=create_callback(item)).place(**args)
+                    button = tkinter.Button(root, text=self.__naming_func(self.__layouts[item]), command=create_callback(item)).place(**args)
         root.mainloop()
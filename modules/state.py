@@ -0,0 +1,152 @@
+import copy
+import logging
+import os
+import pickle
+import queue
+import threading
+
+__all__ = ['StateJournal']
+
+logger = logging.getLogger(__name__)
+
+# The journal is compacted into the checkpoint after this number of records
+COMPACT_AFTER = 256
+
+
+class StateJournal:
+    """
+    Persists the state of the modules, so it survives the daemon being killed
+
+    The state is kept in a checkpoint file, which holds the complete state as one pickle,
+    and a journal next to it, which holds a pickle for every change since the checkpoint.
+    A change only contains the state of the modules that changed, keyed like dump_state_ex().
+
+    Records are pickled on the calling thread and written by a background thread,
+    which also replaces the checkpoint by an atomic rename when the journal is compacted.
+    A record that was only partially written when the daemon was killed is ignored when the state is loaded.
+    """
+
+    def __init__(self, path: str, compact_after: int = COMPACT_AFTER):
+        """
+        :param path: Path of the checkpoint file, the journal is stored in the same path with a .journal suffix
+        :param compact_after: Number of records after which the journal is compacted into the checkpoint
+        """
+        self.__path = path
+        self.__journal_path = path + '.journal'
+        self.__compact_after = compact_after
+        self.__state = {}
+        self.__records = 0
+        self.__queue = queue.Queue()
+        self.__thread = None
+
+    def load(self) -> dict:
+        """
+        Reads the checkpoint and replays the journal on top of it
+
+        :return: dict The saved state, empty when nothing was saved yet
+        """
+        state = {}
+        try:
+            with open(self.__path, 'rb') as f:
+                state.update(pickle.load(f))
+        except (FileNotFoundError, EOFError):
+            pass
+        except pickle.UnpicklingError:
+            # Checkpoints are replaced atomically, so this is not a checkpoint written by the journal
+            logger.exception('%s: Could not read checkpoint %s', self.__class__.__name__, self.__path)
+        records = 0
+        try:
+            with open(self.__journal_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                while True:
+                    offset = f.tell()
+                    if offset == size:
+                        break
+                    try:
+                        change = pickle.load(f)
+                    except (EOFError, pickle.UnpicklingError, ValueError, IndexError, AttributeError):
+                        # A record that was cut off raises any of these, new records are appended after the last complete one
+                        logger.warning('%s: Dropping incomplete record at the end of %s', self.__class__.__name__, self.__journal_path)
+                        os.truncate(self.__journal_path, offset)
+                        break
+                    state.update(change)
+                    records += 1
+        except FileNotFoundError:
+            pass
+        logger.debug('%s: Loaded checkpoint with %d journal records', self.__class__.__name__, records)
+        self.__state = dict(state)
+        self.__records = records
+        if records >= self.__compact_after:
+            self.__checkpoint()
+        return state
+
+    def record(self, state: dict):
+        """
+        Appends the modules whose state differs from the previous record to the journal
+
+        :param state: The complete state, as returned by dump_state_ex()
+        """
+        change = {key: value for key, value in state.items() if key not in self.__state or self.__state[key] != value}
+        if not change:
+            return
+        logger.debug('%s: Recording %r', self.__class__.__name__, change)
+        # Modules may keep changing the objects they dumped, so the recorded state is copied
+        self.__state.update(copy.deepcopy(change))
+        self.__records += 1
+        self.__submit(self.__append, pickle.dumps(change))
+        if self.__records >= self.__compact_after:
+            self.__checkpoint()
+
+    def __checkpoint(self):
+        self.__records = 0
+        self.__submit(self.__replace_checkpoint, pickle.dumps(self.__state))
+
+    def __submit(self, operation: callable, data: bytes):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__write, name=self.__class__.__name__, daemon=True)
+            self.__thread.start()
+        self.__queue.put((operation, data))
+
+    def __write(self):
+        """
+        Runs on the writer thread, until close() is called
+        """
+        while True:
+            operation, data = self.__queue.get()
+            if operation is None:
+                return
+            try:
+                operation(data)
+            except OSError:
+                logger.exception('%s: Could not write state', self.__class__.__name__)
+
+    def __append(self, data: bytes):
+        with open(self.__journal_path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __replace_checkpoint(self, data: bytes):
+        temporary_path = self.__path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.__path)
+        # Records that were already in the journal are in the checkpoint as well, so replaying them again is harmless
+        with open(self.__journal_path, 'wb'):
+            pass
+        logger.debug('%s: Compacted journal into %s', self.__class__.__name__, self.__path)
+
+    def close(self, state: dict):
+        """
+        Records the final state, compacts the journal and waits until everything is written
+
+        :param state: The complete state, as returned by dump_state_ex()
+        """
+        self.record(state)
+        if self.__records:
+            self.__checkpoint()
+        if self.__thread is not None:
+            self.__queue.put((None, None))
+            self.__thread.join()
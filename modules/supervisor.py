@@ -0,0 +1,58 @@
+import logging
+import signal
+import subprocess
+
+__all__ = ['ProcessSupervisor']
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessSupervisor:
+    """
+    Spawns child processes on behalf of modules and reports when they exit
+
+    Exits are noticed when SIGCHLD is delivered to the event loop, only then the supervised children are polled.
+    Children are never reaped periodically, and children that were not spawned through the supervisor are left alone.
+    """
+
+    def __init__(self, loop):
+        """
+        :param loop: The event loop to receive SIGCHLD on
+        """
+        self.__loop = loop
+        self.__children = {}
+        loop.add_signal_handler(signal.SIGCHLD, self.__on_child_exit)
+
+    def spawn(self, args: list, on_exit: callable = None, **kwargs) -> subprocess.Popen:
+        """
+        Starts a child process
+
+        :param args: The program and its arguments
+        :param on_exit: Called on the event loop with the Popen object, after the process has exited
+        :param kwargs: Extra arguments for subprocess.Popen
+        :return: The started process
+        """
+        process = subprocess.Popen(args, **kwargs)
+        self.__children[process.pid] = (process, on_exit)
+        logger.debug('Spawned %r as pid %d', args, process.pid)
+        return process
+
+    def __on_child_exit(self):
+        # Several exits can be reported by a single signal, so all children are checked
+        for pid, (process, on_exit) in list(self.__children.items()):
+            if process.poll() is None:
+                continue
+            del self.__children[pid]
+            logger.debug('Process %r (pid %d) exited with %d', process.args, pid, process.returncode)
+            if on_exit is not None:
+                try:
+                    on_exit(process)
+                except Exception:
+                    logger.exception('Exit callback for process %r failed', process.args)
+
+    def close(self):
+        """
+        Stops watching for exits, children that are still running are not waited for
+        """
+        self.__loop.remove_signal_handler(signal.SIGCHLD)
+        self.__children.clear()
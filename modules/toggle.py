@@ -1,12 +1,14 @@
 import abc
-
+import logging
 import subprocess
+from functools import partial
 
-from modules.util import process_reaper
-from .core import AbstractControl, action
+from .core import AbstractControl
 
 __all__ = ['ToggleControl', 'CommandToggleControl']
 
+logger = logging.getLogger(__name__)
+
 
 class ToggleControl(AbstractControl, metaclass=abc.ABCMeta):
     """
@@ -16,6 +18,9 @@ class ToggleControl(AbstractControl, metaclass=abc.ABCMeta):
     A click on the button toggles the button by calling toggle()
     """
 
+    periodic_interval = None
+    plain_commands = frozenset()
+
     def __init__(self, letter: str, initial_state: bool = False):
         """
         :param letter: The text to show on the toggle control. Will be upper- or lowercased when the button is activated or deactivated.
@@ -75,22 +80,100 @@ class ToggleControl(AbstractControl, metaclass=abc.ABCMeta):
             self.toggle()
             return True
 
-    def __str__(self):
-        return action(
-            self.create_pipe_command(':toggle'),
-            self.__letter.upper() if self.state else self.__letter.lower()
-        )
+    def coalesce(self, commands):
+        # Toggling twice restores the state, so only an odd number of toggles has an effect
+        toggles = commands.count(':toggle')
+        if toggles != len(commands):
+            return commands
+        return commands[:toggles % 2]
+
+    def markup(self):
+        return self.create_action(':toggle')(self.__letter.upper() if self.state else self.__letter.lower())
 
 
 class CommandToggleControl(ToggleControl):
-    def __init__(self, letter: str, enable_command: list, disable_command: list, initial_state: bool = False):
+    """
+    A toggle button that runs a command when it is enabled or disabled
+
+    Commands run in the background, the button shows pending_text while a command is running.
+    The new state is only committed when the command succeeds, when it fails or times out the previous state is kept.
+    Toggles while a command is running are applied once it has finished.
+    """
+
+    def __init__(self, letter: str, enable_command: list, disable_command: list, initial_state: bool = False,
+                 timeout: float = 10, pending_text: str = '~'):
+        """
+        :param letter: The text to show on the toggle control. Will be upper- or lowercased when the button is activated or deactivated.
+        :param enable_command: The command to run when the button is enabled
+        :param disable_command: The command to run when the button is disabled
+        :param initial_state: The initial state of the button (used only when there is no saved data yet)
+        :param timeout: Seconds after which a command is killed and considered failed, or None to wait forever
+        :param pending_text: The text to show while a command is running
+        """
         super().__init__(letter, initial_state)
         self.__enable_command = enable_command
         self.__disable_command = disable_command
+        self.__timeout = timeout
+        self.__pending_text = pending_text
+        self.__process = None
+        self.__pending_state = None
+        self.__timeout_handle = None
+        self.__requested = None
 
-    def enable(self):
-        subprocess.call(self.__enable_command)
+    def toggle(self):
+        # Toggles relative to the state the button is heading to, not the state that is committed
+        if self.__requested is not None:
+            target = self.__requested
+        elif self.__process is not None:
+            target = self.__pending_state
+        else:
+            target = self.state
+        self.state = not target
 
-    def disable(self):
-        subprocess.call(self.__disable_command)
+    @property
+    def state(self) -> bool:
+        return ToggleControl.state.fget(self)
 
+    @state.setter
+    def state(self, state: bool):
+        self.__requested = state
+        if self.__process is None:
+            self.__run_requested()
+
+    def __run_requested(self):
+        state, self.__requested = self.__requested, None
+        if state is None or state == self.state:
+            return
+        command = self.__enable_command if state else self.__disable_command
+        logger.debug('%s: Running %r', self.__class__.__name__, command)
+        try:
+            self.__process = self.runtime.supervisor.spawn(command, on_exit=partial(self.__finished, state),
+                                                           stdin=subprocess.DEVNULL)
+        except OSError:
+            logger.exception('%s: Could not run %r', self.__class__.__name__, command)
+            return
+        self.__pending_state = state
+        if self.__timeout is not None:
+            self.__timeout_handle = self.runtime.loop.call_later(self.__timeout, self.__kill, self.__process)
+        self.invalidate()
+
+    def __kill(self, process):
+        logger.warning('%s: %r did not finish within %s seconds, killing it', self.__class__.__name__, process.args, self.__timeout)
+        process.kill()
+
+    def __finished(self, state, process):
+        self.__process = None
+        if self.__timeout_handle is not None:
+            self.__timeout_handle.cancel()
+            self.__timeout_handle = None
+        if process.returncode == 0:
+            ToggleControl.state.fset(self, state)
+        else:
+            logger.error('%s: %r failed with exit code %d, keeping previous state', self.__class__.__name__, process.args, process.returncode)
+        self.invalidate()
+        self.__run_requested()
+
+    def markup(self):
+        if self.__process is not None:
+            return self.create_action(':toggle')(self.__pending_text)
+        return super().markup()
@@ -0,0 +1,163 @@
+import logging
+import os
+import socket
+import stat
+
+__all__ = ['CommandSocketServer']
+
+logger = logging.getLogger(__name__)
+
+
+class CommandSocketServer:
+    """
+    Accepts commands on a unix domain socket
+
+    Clients send one command per line, and may send several commands over one connection.
+    Every command is answered with one line: 1 when it changed the bar, 0 when it did not.
+    """
+
+    def __init__(self, loop, path: str, handler: callable):
+        """
+        :param loop: The event loop to wait for connections on
+        :param path: Filesystem path of the socket. A stale socket at this path is replaced, a socket that is in use is not.
+        :param handler: Called with a list of commands and a reply function, which must be called with
+            one result per command once the commands are handled
+        """
+        self.__loop = loop
+        self.__path = path
+        self.__handler = handler
+        self.__connections = set()
+        self.__remove_stale_socket()
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.setblocking(False)
+        old_umask = os.umask(0o077)
+        try:
+            self.__socket.bind(path)
+        finally:
+            os.umask(old_umask)
+        self.__socket.listen(16)
+        loop.add_reader(self.__socket, self.__accept)
+        logger.info('Listening for commands on %s', path)
+
+    def __remove_stale_socket(self):
+        try:
+            mode = os.stat(self.__path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise ValueError('%s exists and is not a socket' % self.__path)
+        # Only a socket that nobody listens on is stale, a running daemon keeps its socket
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.__path)
+        except ConnectionRefusedError:
+            os.unlink(self.__path)
+            return
+        finally:
+            probe.close()
+        raise ValueError('%s is in use by another daemon' % self.__path)
+
+    def __accept(self):
+        while True:
+            try:
+                client, _ = self.__socket.accept()
+            except BlockingIOError:
+                return
+            self.__connections.add(_Connection(self.__loop, client, self.__handler, self.__connections.discard))
+
+    def close(self):
+        """
+        Stops accepting commands and removes the socket
+        """
+        for connection in list(self.__connections):
+            connection.close()
+        self.__loop.remove_reader(self.__socket)
+        self.__socket.close()
+        try:
+            os.unlink(self.__path)
+        except FileNotFoundError:
+            pass
+
+
+class _Connection:
+    """
+    A client connection of the command socket
+    """
+
+    def __init__(self, loop, client: socket.socket, handler: callable, on_close: callable):
+        self.__loop = loop
+        self.__client = client
+        self.__handler = handler
+        self.__on_close = on_close
+        self.__buffer = b''
+        self.__replies = b''
+        self.__outstanding = 0
+        self.__eof = False
+        self.__closed = False
+        client.setblocking(False)
+        loop.add_reader(client, self.__read)
+
+    def __read(self):
+        chunks = [self.__buffer]
+        while True:
+            try:
+                data = self.__client.recv(65536)
+            except BlockingIOError:
+                break
+            except ConnectionError:
+                self.close()
+                return
+            if not data:
+                self.__eof = True
+                self.__loop.remove_reader(self.__client)
+                break
+            chunks.append(data)
+        lines = b''.join(chunks).split(b'\n')
+        self.__buffer = lines.pop()
+        if self.__eof and self.__buffer:
+            lines.append(self.__buffer)  # Last command without trailing newline
+            self.__buffer = b''
+        if lines:
+            self.__outstanding += 1
+            self.__handler([line.decode('utf-8', 'replace').rstrip() for line in lines], self.__reply)
+        self.__close_if_done()
+
+    def __close_if_done(self):
+        if self.__eof and not self.__outstanding and not self.__replies:
+            self.close()
+
+    def __reply(self, results):
+        self.__outstanding -= 1
+        if self.__closed:
+            return
+        pending = bool(self.__replies)
+        self.__replies += b''.join(b'1\n' if result else b'0\n' for result in results)
+        if not pending:
+            self.__flush()
+            if self.__replies and not self.__closed:
+                self.__loop.add_writer(self.__client, self.__flush_later)
+
+    def __flush(self):
+        try:
+            sent = self.__client.send(self.__replies)
+        except BlockingIOError:
+            return
+        except ConnectionError:
+            self.close()
+            return
+        self.__replies = self.__replies[sent:]
+        self.__close_if_done()
+
+    def __flush_later(self):
+        self.__flush()
+        if not self.__replies and not self.__closed:
+            self.__loop.remove_writer(self.__client)
+
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__loop.remove_reader(self.__client)
+        self.__loop.remove_writer(self.__client)
+        self.__client.close()
+        self.__on_close(self)
@@ -1,14 +1,17 @@
+import importlib.util
 import sys
-import os.path
-from functools import wraps
+from functools import wraps, lru_cache
 
 import time
 
 from .core import AbstractControl
 
-__all__ = ['ChildReaperControl', 'QuitControl', 'backoff', 'process_reaper']
+__all__ = ['QuitControl', 'backoff', 'module_available']
 
 class QuitControl(AbstractControl):
+    periodic_interval = None
+    plain_commands = frozenset({'q', 'refresh'})
+
     @property
     def visible(self):
         return False
@@ -20,18 +23,6 @@ class QuitControl(AbstractControl):
             return True
 
 
-class ChildReaperControl(AbstractControl):
-    @property
-    def visible(self):
-        return False
-
-    def periodic(self):
-        try:
-            os.wait3(os.WNOHANG)
-        except:
-            pass
-
-
 def backoff(backoff, default=None):
     def decorator(fn):
         last_called = 0
@@ -39,9 +30,9 @@ def backoff(backoff, default=None):
         @wraps(fn)
         def wrapper(*a, **kw):
             nonlocal last_called
-            if last_called + backoff > time.time():
+            if last_called + backoff > time.monotonic():
                 return default
-            last_called = time.time()
+            last_called = time.monotonic()
             return fn(*a, **kw)
 
         return wrapper
@@ -49,18 +40,15 @@ def backoff(backoff, default=None):
     return decorator
 
 
-def process_reaper(fn):
-    process = None
-
-    @wraps(fn)
-    def wrapper(*a, **kw):
-        nonlocal process
-        if process is not None:
-            process.poll()
-            if process.returncode is not None:
-                process = None
+@lru_cache(maxsize=None)
+def module_available(name: str) -> bool:
+    """
+    Checks whether a module can be imported, without importing it
 
-        if process is None:
-            process = fn(*a, **kw)
-
-    return wrapper
+    :param name: The full name of the module
+    :return: bool
+    """
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ValueError:
+        return False
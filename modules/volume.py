@@ -2,15 +2,21 @@ import subprocess
 import logging
 import abc
 import math
+from functools import partial
 
-from .core import AbstractControl, action, Button
+from .core import AbstractControl, Button
+from .util import module_available
 
 logger = logging.getLogger(__name__)
 
-__all__ = ['AbstractControl', 'PaCtlVolumeControl', 'VolumeControl']
+__all__ = ['AbstractControl', 'PaCtlVolumeControl', 'PulseCtlVolumeControl', 'VolumeControl']
 
 
 class AbstractVolumeControl(AbstractControl, metaclass=abc.ABCMeta):
+    periodic_interval = None
+    plain_commands = frozenset({'m1', 'm0', 'mt', '+', '-', 'r'})
+    plain_command_prefixes = ('=',)
+
     @abc.abstractmethod
     def _set_muted(self, muted: bool) -> bool:
         pass
@@ -69,24 +75,41 @@ class AbstractVolumeControl(AbstractControl, metaclass=abc.ABCMeta):
             self.volume -= 1 / 30.0
         elif command == 'r':
             self.volume = 1 / 3.0
+        elif command[1:].isdigit() and command[0] in '+-':
+            # Coalesced steps, see coalesce()
+            steps = int(command[1:])
+            self.volume += (steps if command[0] == '+' else -steps) / 30.0
         else:
             return False
         return True
 
-    def __str__(self):
-        return action(
-            self.create_pipe_command('+'),
-            action(
-                self.create_pipe_command('-'),
-                self.action_bars(create_bars(self._volume) if not self.muted else '  (mute)  '),
-                button=Button.SCROLL_DOWN
-            ),
-            button=Button.SCROLL_UP
-        )
+    def coalesce(self, commands):
+        coalesced = []
+        for command in commands:
+            last = coalesced[-1] if coalesced else ''
+            if command in ('+', '-') and last[:1] == command:
+                # Steps in the same direction add up, opposite steps are kept apart because of clamping
+                coalesced[-1] = '%s%d' % (command, int(last[1:] or 1) + 1)
+            elif command == 'r' or command[0] == '=':
+                # Setting the volume overrides all volume changes since the last mute change
+                while coalesced and coalesced[-1] not in ('m1', 'm0', 'mt'):
+                    coalesced.pop()
+                coalesced.append(command)
+            elif command in ('m1', 'm0') and last in ('m1', 'm0'):
+                coalesced[-1] = command
+            elif command == 'mt' and last == 'mt':
+                coalesced.pop()
+            else:
+                coalesced.append(command)
+        return coalesced
+
+    def markup(self):
+        volume_up = self.create_action('+', button=Button.SCROLL_UP)
+        volume_down = self.create_action('-', button=Button.SCROLL_DOWN)
+        return volume_up(volume_down(self.action_bars(create_bars(self._volume) if not self.muted else '  (mute)  ')))
 
     def action_bars(self, bars):
-        return ''.join([action(self.create_pipe_command('=%d' % (i + 1)), c, button=Button.LEFT) for i, c in
-                        zip(range(len(bars)), bars)])
+        return [self.create_action('=%d' % (i + 1), button=Button.LEFT)(c) for i, c in enumerate(bars)]
 
     def load_state(self, state):
         self.volume = state['volume']
@@ -115,21 +138,94 @@ def partial_bar(bar_size):
 
 
 class PaCtlVolumeControl(AbstractVolumeControl):
+    """
+    Controls the volume of the default sink with pactl
+
+    Writes are debounced: the shown state changes immediately, but only the latest state is written,
+    at most once every write_interval seconds. Mute and volume changes that are pending together are written by
+    the same flush, but pactl sets them one after the other, so other clients may see the state in between.
+    They are ordered so the sink is never audible at the old volume: a sink is muted before and unmuted after its volume is set.
+    """
+
+    def __init__(self, write_interval: float = 0.1):
+        """
+        :param write_interval: Minimum time between two writes (in seconds)
+        """
+        super().__init__()
+        self.__write_interval = write_interval
+        self.__pending = {}
+        self.__writing = False
+        self.__last_write = None
+        self.__flush_handle = None
+
     def _set_volume(self, volume: float) -> bool:
-        try:
-            self._pactl('set-sink-volume', str(int(volume * 90000)))
-            return True
-        except subprocess.CalledProcessError:
-            logger.exception("Error setting volume")
-            return False
+        self.__queue('set-sink-volume', str(int(volume * 90000)))
+        return True
 
     def _set_muted(self, muted: bool) -> bool:
+        self.__queue('set-sink-mute', str(int(muted)))
+        return True
+
+    def __queue(self, command, arg):
+        # A newer value for the same setting replaces the pending one
+        self.__pending[command] = arg
+        self.__schedule_flush()
+
+    def __schedule_flush(self):
+        if self.__writing or self.__flush_handle is not None:
+            return
+        loop = self.runtime.loop
+        delay = 0 if self.__last_write is None else max(0, self.__last_write + self.__write_interval - loop.time())
+        self.__flush_handle = loop.call_later(delay, self.__flush)
+
+    def __flush(self):
+        self.__flush_handle = None
+        commands = sorted(self.__pending.items(), key=self.__write_order)
+        self.__pending.clear()
+        self.__writing = True
+        self.__last_write = self.runtime.loop.time()
+        self.__write(commands)
+
+    @staticmethod
+    def __write_order(pending) -> int:
+        command, arg = pending
+        if command == 'set-sink-mute':
+            return 0 if arg == '1' else 2
+        return 1
+
+    def __write(self, commands):
+        """
+        Runs the pactl commands one after the other, without waiting for them on the loop
+        """
+        if not commands:
+            self.__writing = False
+            if self.__pending:
+                self.__schedule_flush()
+            return
+        command, arg = commands[0]
+        logger.debug("Calling pactl: %s %s %s", command, '@DEFAULT_SINK@', arg)
         try:
-            self._pactl('set-sink-mute', str(int(muted)))
-            return True
-        except subprocess.CalledProcessError:
-            logger.exception("Error setting mute")
-            return False
+            self.runtime.supervisor.spawn(["pactl", command, '@DEFAULT_SINK@', arg], on_exit=partial(self.__written, commands[1:]),
+                                          stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            logger.exception("Error calling pactl %s", command)
+            self.__write(commands[1:])
+
+    def __written(self, commands, process):
+        if process.returncode:
+            logger.error("Error calling pactl %s: exit code %d", process.args[1], process.returncode)
+        self.__write(commands)
+
+    def cleanup(self):
+        # Pending changes are written before the daemon exits
+        if self.__flush_handle is not None:
+            self.__flush_handle.cancel()
+        for command, arg in sorted(self.__pending.items(), key=self.__write_order):
+            try:
+                self._pactl(command, arg)
+            except subprocess.CalledProcessError:
+                logger.exception("Error calling pactl %s", command)
+        self.__pending.clear()
 
     def _pactl(self, command, arg):
         logger.debug("Calling pactl: %s %s %s", command, '@DEFAULT_SINK@', arg)
@@ -137,38 +233,63 @@ class PaCtlVolumeControl(AbstractVolumeControl):
                               stderr=subprocess.DEVNULL)
 
 
-try:
-    import pulsectl
+class PulseCtlVolumeControl(AbstractVolumeControl):
+    """
+    Controls the volume of the default sink through the shared pulseaudio client
 
+    The volume is not polled, it is refreshed when pulseaudio reports a change.
+    """
 
-    class PulseCtlVolumeControl(AbstractVolumeControl):
-        def __init__(self):
-            super().__init__()
-            self.__pulse = pulsectl.Pulse(self.__class__.__name__)
-            self.__default_sink = None
-            self.periodic()
+    periodic_interval = None
 
-        def periodic(self):
-            server_info = self.__pulse.server_info()
-            self.__default_sink = next(
-                filter(lambda sink: sink.name == server_info.default_sink_name, self.__pulse.sink_list()))
-            prev_muted = self.muted
-            self.muted = bool(self.__default_sink.mute)
-            prev_volume = self.volume
-            if not self.muted:
-                self.volume = self.__default_sink.volume.value_flat
-            return prev_muted != self.muted or prev_volume != self.volume
+    def __init__(self):
+        super().__init__()
+        self.__pulse = None
+        self.__default_sink = None
+
+    def bind_runtime(self, runtime):
+        super().bind_runtime(runtime)
+        self.__pulse = runtime.pulse
+        self.__pulse.add_listener(self.__pulse_changed)
+        self.__refresh()
+
+    def __pulse_changed(self, changes: set):
+        # Only changes of the server (the default sink may have changed) or of the default sink itself are shown
+        sink = self.__default_sink
+        if sink is None or any(facility == 'server' or (facility == 'sink' and index == sink.index) for facility, index in changes):
+            self.__refresh()
+
+    def __refresh(self):
+        """
+        Shows the state of the default sink, without writing it back to pulseaudio
+        """
+        sink = self.__pulse.default_sink()
+        self.__default_sink = sink
+        if sink is None:
+            return
+        muted = bool(sink.mute)
+        volume = int(min(sink.volume.value_flat, 1.0) * 90000)
+        if (muted, volume) == (self._muted, self._volume):
+            return
+        self._muted = muted
+        self._volume = volume
+        self.invalidate()
 
-        def _set_muted(self, muted: bool) -> bool:
-            self.__pulse.sink_mute(self.__default_sink.index, muted)
-            return True
+    def _set_muted(self, muted: bool) -> bool:
+        if self.__default_sink is None:
+            return False
+        self.__pulse.sink_mute(self.__default_sink.index, muted)
+        return True
 
-        def _set_volume(self, volume: float) -> bool:
-            self.__default_sink.volume.value_flat = volume
-            self.__pulse.sink_volume_set(self.__default_sink.index, self.__default_sink.volume)
-            return True
+    def _set_volume(self, volume: float) -> bool:
+        import pulsectl
+        sink = self.__default_sink
+        if sink is None:
+            return False
+        # The sink belongs to the snapshot of the PulseService, so its volume is not changed in place
+        self.__pulse.sink_volume_set(sink.index, pulsectl.PulseVolumeInfo(volume, len(sink.volume.values)))
+        return True
 
 
-    VolumeControl = PulseCtlVolumeControl
-except ImportError:
-    VolumeControl = PaCtlVolumeControl
+# The pulseaudio client is preferred, it is only imported once the volume control is bound to the runtime
+VolumeControl = PulseCtlVolumeControl if module_available('pulsectl') else PaCtlVolumeControl
@@ -0,0 +1,67 @@
+import pytest
+
+
+class FakeHandle:
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    """
+    An event loop with a clock that only moves when the test advances it
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+        self.writers = {}
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        handle = FakeHandle(when, callback, args)
+        self.timers.append(handle)
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def call_soon(self, callback, *args):
+        return self.call_at(self.now, callback, *args)
+
+    def add_writer(self, fd, callback, *args):
+        self.writers[fd] = (callback, args)
+
+    def remove_writer(self, fd):
+        return self.writers.pop(fd, None) is not None
+
+    @property
+    def pending_timers(self):
+        return [handle for handle in self.timers if not handle.cancelled]
+
+    def advance(self, seconds):
+        """
+        Moves the clock forward, running the timers that become due in the order of their deadlines
+        """
+        end = self.now + seconds
+        while True:
+            due = [handle for handle in self.pending_timers if handle.when <= end]
+            if not due:
+                break
+            handle = min(due, key=lambda h: h.when)
+            self.timers.remove(handle)
+            self.now = max(self.now, handle.when)
+            handle.callback(*handle.args)
+        self.now = end
+
+
+@pytest.fixture
+def loop():
+    return FakeLoop()
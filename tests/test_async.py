@@ -0,0 +1,145 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+import modules
+from modules.core import AbstractControl, GroupedControl, WrappingControl
+from modules.util import QuitControl
+
+
+class AsyncCounter(AbstractControl):
+    """
+    A control that only implements the coroutine hooks, the blocking hooks must not be used
+    """
+
+    periodic_interval = 60
+
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.delay = delay
+        self.count = 0
+        self.commands = []
+        self.running = 0
+        self.overlapped = False
+        self.cleaned_up = False
+        self.invalidated = 0
+
+    async def __sleep(self):
+        self.running += 1
+        self.overlapped = self.overlapped or self.running > 1
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+
+    def periodic(self):
+        raise AssertionError('periodic() called instead of periodic_async()')
+
+    async def periodic_async(self):
+        await self.__sleep()
+        self.count += 1
+        return True
+
+    def respond_to(self, command):
+        raise AssertionError('respond_to() called instead of respond_to_async()')
+
+    async def respond_to_async(self, command):
+        await self.__sleep()
+        self.commands.append(command)
+        return True
+
+    def coalesce(self, commands):
+        return [':add:%d' % len(commands)] if len(commands) > 1 else commands
+
+    def cleanup(self):
+        raise AssertionError('cleanup() called instead of cleanup_async()')
+
+    async def cleanup_async(self):
+        self.cleaned_up = True
+
+    def invalidate(self):
+        self.invalidated += 1
+        super().invalidate()
+
+    def __str__(self):
+        return '%d/%d' % (self.count, len(self.commands))
+
+
+def test_grouped_control_gathers_periodic_async():
+    first, second = AsyncCounter(delay=0.01), AsyncCounter(delay=0.01)
+    group = GroupedControl(first, second)
+    assert asyncio.run(group.periodic_async()) is True
+    assert first.count == second.count == 1
+    assert first.invalidated == second.invalidated == 1
+    # Both children were awaited at the same time
+    shared = AsyncCounter(delay=0.01)
+    assert asyncio.run(GroupedControl(shared, shared).periodic_async()) is True
+    assert shared.overlapped
+
+
+def test_wrapping_control_forwards_to_the_async_hooks_of_its_child():
+    child = AsyncCounter()
+    wrapper = WrappingControl(child)
+    wrapper.set_name_ex('')
+
+    async def run():
+        assert await wrapper.periodic_async() is True
+        assert await wrapper.respond_to_async(':AsyncCounter:add') is True
+        await wrapper.cleanup_async()
+
+    asyncio.run(run())
+    assert child.count == 1
+    assert child.commands == [':add']
+    assert child.cleaned_up
+
+
+def test_wrapping_control_prefers_customized_blocking_hooks():
+    class Customized(WrappingControl):
+        def respond_to(self, command):
+            return command == ':custom'
+
+    child = AsyncCounter()
+    assert asyncio.run(Customized(child).respond_to_async(':custom')) is True
+    assert child.commands == []
+
+
+@pytest.fixture
+def fifos(tmp_path):
+    output, commands = str(tmp_path / 'out'), str(tmp_path / 'cmd')
+    os.mkfifo(output)
+    os.mkfifo(commands)
+    return output, commands
+
+
+def test_run_async_dispatches_batches_and_cleans_up(fifos, monkeypatch):
+    output, commands = fifos
+    counter = AsyncCounter(delay=0.01)
+    app = modules.Application(QuitControl(), counter)
+    monkeypatch.setattr(sys, 'argv', ['daemon', output, commands])
+    frames = []
+
+    def send(*lines):
+        with open(commands, 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+
+    def bar():
+        with open(output) as f:
+            for frame in f:
+                frames.append(frame.rstrip('\n'))
+                if frames[-1] == '1/0':
+                    send(*[':Application:1:AsyncCounter:add'] * 3)
+                elif frames[-1] == '1/1':
+                    send('q')
+
+    threading.Thread(target=bar, daemon=True).start()
+    # Stops the daemon when the frames never arrive, the asserts report what is missing
+    watchdog = threading.Timer(5, send, ('q',))
+    watchdog.start()
+    # The quit command raises SystemExit in the daemon, which shuts it down
+    app.run_async()
+    watchdog.cancel()
+    assert frames[-1] == '1/1'
+    assert counter.count == 1
+    assert counter.commands == [':add:3']
+    assert counter.cleaned_up
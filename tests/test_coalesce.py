@@ -0,0 +1,104 @@
+import itertools
+from collections import OrderedDict
+
+import pytest
+
+from modules.cycle import CycleControl, ExpandedCycleControlAction, OrderedDictCycleAction
+from modules.toggle import ToggleControl
+from modules.volume import AbstractVolumeControl
+
+
+class MemoryVolumeControl(AbstractVolumeControl):
+    def _set_muted(self, muted):
+        return True
+
+    def _set_volume(self, volume):
+        return True
+
+    @property
+    def state(self):
+        return self.muted, self.volume
+
+
+def cycle():
+    return CycleControl(OrderedDictCycleAction(OrderedDict([('a', 'A'), ('b', 'B'), ('c', 'C')])))
+
+
+def expanded_cycle():
+    return ExpandedCycleControlAction(OrderedDictCycleAction(OrderedDict([('a', 'A'), ('b', 'B'), ('c', 'C')])))
+
+
+def apply(control, commands):
+    for command in commands:
+        control.respond_to(command)
+    return control
+
+
+def sequences(alphabet, max_length=4):
+    for length in range(2, max_length + 1):
+        for commands in itertools.product(alphabet, repeat=length):
+            yield list(commands)
+
+
+@pytest.mark.parametrize('commands, expected', [
+    ([':next', ':next', ':next'], [':seek:3']),
+    ([':next', ':prev'], []),
+    ([':prev', ':prev', ':next'], [':seek:-1']),
+    ([':next', ':other', ':next'], [':seek:1', ':other', ':seek:1']),
+])
+def test_cycle_control_folds_steps_into_a_seek(commands, expected):
+    assert cycle().coalesce(commands) == expected
+
+
+def test_cycle_control_reaches_the_same_item():
+    for commands in sequences([':next', ':prev']):
+        coalesced = cycle().coalesce(commands)
+        assert apply(cycle(), coalesced).child.current == apply(cycle(), commands).child.current, commands
+
+
+@pytest.mark.parametrize('commands, expected', [
+    ([':set:a', ':set:b', ':set:c'], [':set:c']),
+    ([':set:a', ':other', ':set:c'], [':set:a', ':other', ':set:c']),
+])
+def test_expanded_cycle_keeps_the_last_jump(commands, expected):
+    assert expanded_cycle().coalesce(commands) == expected
+
+
+def test_expanded_cycle_reaches_the_same_item():
+    for commands in sequences([':set:a', ':set:b', ':set:c']):
+        coalesced = expanded_cycle().coalesce(commands)
+        assert apply(expanded_cycle(), coalesced).current == apply(expanded_cycle(), commands).current, commands
+
+
+@pytest.mark.parametrize('commands, expected', [
+    (['+', '+', '+'], ['+3']),
+    (['+', '-', '-'], ['+', '-2']),
+    (['+', '=5', '-'], ['=5', '-']),
+    (['+', 'm1', '+', 'r'], ['+', 'm1', 'r']),
+    (['m1', 'm0', 'm1'], ['m1']),
+    (['mt', 'mt', 'mt'], ['mt']),
+])
+def test_volume_folds_steps_and_overridden_changes(commands, expected):
+    assert MemoryVolumeControl().coalesce(commands) == expected
+
+
+@pytest.mark.parametrize('initial_volume', [0.0, 0.5, 0.98])
+def test_volume_reaches_the_same_state(initial_volume):
+    for commands in sequences(['+', '-', 'r', '=9', 'm1', 'm0', 'mt']):
+        raw = MemoryVolumeControl()
+        raw.volume = initial_volume
+        coalesced = MemoryVolumeControl()
+        coalesced.volume = initial_volume
+        apply(raw, commands)
+        apply(coalesced, coalesced.coalesce(commands))
+        assert coalesced.muted == raw.muted, commands
+        # Volumes are stored in steps of 1/90000, summed steps may round differently
+        assert coalesced.volume == pytest.approx(raw.volume, abs=1e-4), commands
+
+
+@pytest.mark.parametrize('commands, expected', [
+    ([':toggle', ':toggle'], []),
+    ([':toggle', ':toggle', ':toggle'], [':toggle']),
+])
+def test_toggle_keeps_an_odd_number_of_toggles(commands, expected):
+    assert ToggleControl('t').coalesce(commands) == expected
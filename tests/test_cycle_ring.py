@@ -0,0 +1,115 @@
+import pytest
+
+from modules.cycle import CycleRing, OrderedDictCycleAction
+
+
+def ring(*keys):
+    return CycleRing({key: key.upper() for key in keys})
+
+
+def test_first_item_is_current():
+    assert ring('a', 'b', 'c').current == 'a'
+    assert CycleRing().current is None
+
+
+def test_seek_wraps_around():
+    items = ring('a', 'b', 'c')
+    items.seek(1)
+    assert items.current == 'b'
+    items.seek(-2)
+    assert items.current == 'c'
+    items.seek(7)
+    assert items.current == 'a'
+
+
+def test_seek_to():
+    items = ring('a', 'b', 'c')
+    items.seek_to('c')
+    assert items.current == 'c'
+    assert items.rotated() == ['c', 'a', 'b']
+    with pytest.raises(KeyError):
+        items.seek_to('d')
+
+
+def test_deleting_an_item_before_the_current_keeps_the_current_item():
+    items = ring('a', 'b', 'c', 'd')
+    items.seek_to('c')
+    del items['a']
+    assert items.current == 'c'
+    items.seek_to('d')
+    assert items.current == 'd'
+    assert list(items) == ['b', 'c', 'd']
+
+
+def test_deleting_an_item_after_the_current_keeps_the_current_item():
+    items = ring('a', 'b', 'c', 'd')
+    items.seek_to('b')
+    del items['c']
+    assert items.current == 'b'
+    items.seek(1)
+    assert items.current == 'd'
+
+
+def test_deleting_the_current_item_moves_to_the_next_one():
+    items = ring('a', 'b', 'c')
+    items.seek_to('b')
+    del items['b']
+    assert items.current == 'c'
+
+
+def test_deleting_the_current_last_item_wraps_around():
+    items = ring('a', 'b', 'c')
+    items.seek_to('c')
+    del items['c']
+    assert items.current == 'a'
+    del items['a']
+    del items['b']
+    assert items.current is None
+    assert len(items) == 0
+
+
+def test_positions_are_updated_after_a_delete():
+    items = ring('a', 'b', 'c', 'd', 'e')
+    del items['b']
+    for key in ('a', 'c', 'd', 'e'):
+        items.seek_to(key)
+        assert items.current == key
+        assert items[key] == key.upper()
+
+
+def test_readded_items_go_to_the_end():
+    items = ring('a', 'b', 'c')
+    del items['a']
+    items['a'] = 'A again'
+    assert list(items) == ['b', 'c', 'a']
+    items.seek_to('a')
+    assert items.current == 'a'
+    assert items['a'] == 'A again'
+
+
+def test_replacing_a_value_keeps_its_position():
+    items = ring('a', 'b')
+    items.seek_to('b')
+    items['b'] = 'new'
+    assert list(items) == ['a', 'b']
+    assert items.current == 'b'
+
+
+def test_clear_resets_the_current_item():
+    items = ring('a', 'b')
+    items.seek(1)
+    items.clear()
+    assert items.current is None
+    items['x'] = 'X'
+    assert items.current == 'x'
+
+
+def test_cycle_action_shares_a_ring_that_it_is_given():
+    items = ring('a', 'b', 'c')
+    action = OrderedDictCycleAction(items)
+    action.next()
+    del items['a']
+    assert action.current == 'b'
+    assert str(action) == 'B'
+    assert action.seek_to('c') and items.current == 'c'
+    assert not action.seek_to('a')
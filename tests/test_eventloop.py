@@ -0,0 +1,70 @@
+import os
+import threading
+
+import pytest
+
+from modules.eventloop import EventLoop
+
+
+@pytest.fixture
+def event_loop():
+    loop = EventLoop()
+    yield loop
+    loop.close()
+
+
+def run_until_stopped(loop, timeout=5):
+    # A loop that is never stopped fails the test instead of hanging it
+    guard = loop.call_later(timeout, loop.stop)
+    loop.run_forever()
+    assert not guard.cancelled
+    guard.cancel()
+
+
+def test_timers_run_in_the_order_of_their_deadlines(event_loop):
+    calls = []
+    event_loop.call_later(0.03, calls.append, 'late')
+    event_loop.call_later(0.01, calls.append, 'early')
+    event_loop.call_soon(calls.append, 'soon')
+    event_loop.call_later(0.05, event_loop.stop)
+    run_until_stopped(event_loop)
+    assert calls == ['soon', 'early', 'late']
+
+
+def test_cancelled_timers_do_not_run(event_loop):
+    calls = []
+    handle = event_loop.call_later(0.01, calls.append, 'cancelled')
+    event_loop.call_later(0.02, event_loop.stop)
+    handle.cancel()
+    run_until_stopped(event_loop)
+    assert calls == []
+
+
+def test_readers_run_when_data_arrives(event_loop):
+    read_fd, write_fd = os.pipe()
+    received = []
+
+    def read():
+        received.append(os.read(read_fd, 100))
+        event_loop.stop()
+
+    event_loop.add_reader(read_fd, read)
+    event_loop.call_later(0.01, os.write, write_fd, b'command\n')
+    run_until_stopped(event_loop)
+    assert received == [b'command\n']
+    assert event_loop.remove_reader(read_fd)
+    assert not event_loop.remove_reader(read_fd)
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def test_call_soon_threadsafe_wakes_up_the_loop(event_loop):
+    calls = []
+
+    def notify():
+        calls.append(threading.current_thread())
+        event_loop.stop()
+
+    threading.Timer(0.01, event_loop.call_soon_threadsafe, (notify,)).start()
+    run_until_stopped(event_loop)
+    assert calls == [threading.main_thread()]
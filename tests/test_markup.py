@@ -0,0 +1,36 @@
+from modules.core import Button
+from modules.markup import Action, ActionTemplate, render, strip_actions
+
+
+def test_templates_format_the_opening_tag_once():
+    template = ActionTemplate('cmd next', Button.SCROLL_UP)
+    assert template.open_tag == '<action=`cmd next` button=4>'
+    assert ActionTemplate('cmd').open_tag == '<action=`cmd`>'
+
+
+def test_render_nested_actions():
+    outer = ActionTemplate('next', Button.LEFT)
+    inner = ActionTemplate('prev', Button.RIGHT)
+    tree = ['[', outer(inner('X')), '] ', ActionTemplate('toggle')(['a', 'b'])]
+    assert render(tree) == '[<action=`next` button=1><action=`prev` button=3>X</action></action>] <action=`toggle`>ab</action>'
+    assert str(outer('Y')) == '<action=`next` button=1>Y</action>'
+
+
+def test_applying_a_template_does_not_render():
+    template = ActionTemplate('cmd')
+    action = template(['a', 'b'])
+    assert isinstance(action, Action)
+    assert action.template is template
+    assert action.text == ['a', 'b']
+
+
+def test_strip_actions_keeps_the_text():
+    template = ActionTemplate('cmd')
+    tree = ['a', template(['b', template('c')]), 'd']
+    assert strip_actions(tree) == ['a', ['b', 'c'], 'd']
+    assert render(strip_actions(tree)) == 'abcd'
+
+
+def test_strip_actions_leaves_rendered_strings_alone():
+    rendered = render(ActionTemplate('cmd')('x'))
+    assert strip_actions(rendered) == rendered
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from modules.output import FrameWriter
+
+
+@pytest.fixture
+def pipe():
+    # The write end is owned by the FrameWriter, which closes it
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    yield read_fd, write_fd
+    os.close(read_fd)
+
+
+def read_all(fd):
+    chunks = []
+    while True:
+        try:
+            chunk = os.read(fd, 65536)
+        except BlockingIOError:
+            return b''.join(chunks)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def flush(loop, read_fd):
+    """
+    Drains the pipe and lets the writer continue, until it has written everything
+    """
+    data = b''
+    while loop.writers:
+        data += read_all(read_fd)
+        for fd, (callback, args) in list(loop.writers.items()):
+            callback(*args)
+    return data + read_all(read_fd)
+
+
+def fill_pipe(write_fd):
+    """
+    Writes to the pipe until it is full, the pipe is non-blocking once it is passed to a FrameWriter
+    """
+    size = 0
+    while True:
+        try:
+            size += os.write(write_fd, b'x' * 4096)
+        except BlockingIOError:
+            return size
+
+
+def test_frames_are_written_with_a_newline(loop, pipe):
+    read_fd, write_fd = pipe
+    writer = FrameWriter(loop, write_fd)
+    writer.write('first')
+    writer.write('second')
+    assert read_all(read_fd) == b'first\nsecond\n'
+    assert not loop.writers
+    assert writer.delayed_frames == writer.dropped_frames == 0
+    writer.close()
+
+
+def test_full_pipe_keeps_only_the_latest_frame(loop, pipe):
+    read_fd, write_fd = pipe
+    writer = FrameWriter(loop, write_fd)
+    filled = fill_pipe(write_fd)
+    writer.write('stale 1')
+    writer.write('stale 2')
+    writer.write('latest')
+    assert write_fd in loop.writers
+    data = flush(loop, read_fd)
+    assert data == b'x' * filled + b'stale 1\nlatest\n'
+    assert writer.dropped_frames == 1
+    assert writer.delayed_frames == 2
+    writer.close()
+
+
+def test_partially_written_frames_are_completed_first(loop, pipe):
+    read_fd, write_fd = pipe
+    writer = FrameWriter(loop, write_fd)
+    large = 'y' * 1000000
+    writer.write(large)
+    writer.write('next')
+    assert write_fd in loop.writers
+    assert flush(loop, read_fd) == (large + '\nnext\n').encode()
+    assert writer.dropped_frames == 0
+    writer.close()
+
+
+def test_close_closes_the_pipe_and_stops_waiting(loop, pipe):
+    read_fd, write_fd = pipe
+    writer = FrameWriter(loop, write_fd)
+    fill_pipe(write_fd)
+    writer.write('pending')
+    writer.close()
+    assert not loop.writers
+    with pytest.raises(OSError):
+        os.fstat(write_fd)
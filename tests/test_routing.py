@@ -0,0 +1,96 @@
+from modules.routing import CommandRouter
+
+
+class Recorder:
+    def __init__(self, name, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.commands = []
+        self.invalidated = 0
+
+    def respond_to(self, command):
+        self.commands.append(command)
+        return True
+
+    def invalidate(self):
+        self.invalidated += 1
+
+    def coalesce(self, commands):
+        return commands
+
+    def __repr__(self):
+        return 'Recorder(%r)' % self.name
+
+
+def test_namespaced_commands_resolve_to_the_longest_namespace():
+    router = CommandRouter()
+    app, group, child = Recorder('app'), Recorder('group'), Recorder('child')
+    router.add_namespace(':Application', app)
+    router.add_namespace(':Application:1:GroupedControl', group)
+    router.add_namespace(':Application:1:GroupedControl:2:CycleControl', child)
+    assert router.resolve(':Application:1:GroupedControl:2:CycleControl:next') == [(child, ':next')]
+    assert router.resolve(':Application:1:GroupedControl:3:ToggleControl:toggle') == [(group, ':3:ToggleControl:toggle')]
+    assert router.resolve(':Application:quit') == [(app, ':quit')]
+
+
+def test_namespaces_only_match_whole_segments():
+    router = CommandRouter()
+    short, long = Recorder('short'), Recorder('long')
+    router.add_namespace(':Application:1:T', short)
+    router.add_namespace(':Application:12:T', long)
+    assert router.resolve(':Application:12:T:toggle') == [(long, ':toggle')]
+    assert router.resolve(':Application:1:T:toggle') == [(short, ':toggle')]
+    assert router.resolve(':Application:1:TT:toggle') == []
+
+
+def test_unknown_namespaced_commands_resolve_to_nothing():
+    router = CommandRouter()
+    router.add_namespace(':Application:1:T', Recorder('t'))
+    assert router.resolve(':Other:1:T:toggle') == []
+    assert router.dispatch(':Other:1:T:toggle') is False
+
+
+def test_plain_commands_resolve_to_declared_prefixed_and_broadcast_controls():
+    router = CommandRouter()
+    volume, layout, legacy = Recorder('volume'), Recorder('layout'), Recorder('legacy')
+    router.add_plain_commands(volume, ['+', '-'])
+    router.add_plain_commands(layout, [], prefixes=['layout:'])
+    router.add_plain_commands(legacy, None)
+    assert router.resolve('+') == [(volume, '+'), (legacy, '+')]
+    assert router.resolve('layout:dual') == [(layout, 'layout:dual'), (legacy, 'layout:dual')]
+    assert router.resolve('other') == [(legacy, 'other')]
+
+
+def test_resolutions_are_recomputed_when_routes_change():
+    router = CommandRouter()
+    outer, inner = Recorder('outer'), Recorder('inner')
+    router.add_namespace(':Application', outer)
+    assert router.resolve(':Application:1:T:toggle') == [(outer, ':1:T:toggle')]
+    router.add_namespace(':Application:1:T', inner)
+    assert router.resolve(':Application:1:T:toggle') == [(inner, ':toggle')]
+
+
+def test_dispatch_skips_disabled_controls():
+    router = CommandRouter()
+    enabled, disabled = Recorder('enabled'), Recorder('disabled', enabled=False)
+    router.add_plain_commands(enabled, ['x'])
+    router.add_plain_commands(disabled, ['x'])
+    assert router.dispatch('x') is True
+    assert enabled.commands == ['x'] and enabled.invalidated == 1
+    assert disabled.commands == [] and disabled.invalidated == 0
+
+
+def test_dispatch_all_coalesces_runs_of_commands_for_the_same_control():
+    class Counter(Recorder):
+        def coalesce(self, commands):
+            return [':add:%d' % len(commands)]
+
+    router = CommandRouter()
+    first, second = Counter('first'), Counter('second')
+    router.add_namespace(':A:1:C', first)
+    router.add_namespace(':A:2:C', second)
+    results = router.dispatch_all([':A:1:C:add', ':A:1:C:add', ':A:2:C:add', ':A:1:C:add'])
+    assert results == [True, True, True, True]
+    # Single commands are passed on as they are
+    assert first.commands == [':add:2', ':add']
+    assert second.commands == [':add']
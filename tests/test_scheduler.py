@@ -0,0 +1,147 @@
+import pytest
+
+from modules import scheduler
+from modules.scheduler import Scheduler, RESOLUTION
+
+
+class Ticker:
+    def __init__(self, loop, interval, align=False, changes=True, duration=0.0):
+        self.loop = loop
+        self.periodic_interval = interval
+        self.periodic_align = align
+        self.enabled = True
+        self.changes = changes
+        self.duration = duration
+        self.calls = []
+        self.invalidated = 0
+
+    def periodic(self):
+        self.calls.append(self.loop.time())
+        self.loop.now += self.duration
+        return self.changes
+
+    def invalidate(self):
+        self.invalidated += 1
+
+
+@pytest.fixture
+def changes():
+    return []
+
+
+@pytest.fixture
+def schedule(loop, changes):
+    return Scheduler(loop, lambda: changes.append(loop.time()))
+
+
+def test_first_call_is_immediate(loop, schedule):
+    control = Ticker(loop, 1)
+    schedule.add(control)
+    loop.advance(0)
+    assert control.calls == [0.0]
+    assert control.invalidated == 1
+
+
+def test_controls_due_together_share_one_wakeup(loop, schedule, changes):
+    first, second = Ticker(loop, 1), Ticker(loop, 1)
+    schedule.add(first)
+    schedule.add(second)
+    assert len(loop.pending_timers) == 1
+    loop.advance(2)
+    assert first.calls == second.calls == [0.0, 1.0, 2.0]
+    assert changes == [0.0, 1.0, 2.0]
+
+
+def test_controls_within_resolution_run_on_the_same_wakeup(loop, schedule):
+    first = Ticker(loop, 1)
+    second = Ticker(loop, 1)
+    schedule.add(first)
+    loop.now = RESOLUTION / 2
+    schedule.add(second)
+    loop.now = 0.0
+    loop.advance(0)
+    assert first.calls == second.calls == [0.0]
+
+
+def test_only_the_earliest_deadline_is_armed(loop, schedule):
+    slow, fast = Ticker(loop, 10), Ticker(loop, 1)
+    schedule.add(slow)
+    schedule.add(fast)
+    loop.advance(0)
+    assert [handle.when for handle in loop.pending_timers] == [1.0]
+    loop.advance(5)
+    assert slow.calls == [0.0]
+    assert fast.calls == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_deadlines_do_not_drift_with_the_duration_of_periodic(loop, schedule):
+    control = Ticker(loop, 1, duration=0.1)
+    schedule.add(control)
+    loop.advance(3)
+    assert control.calls == pytest.approx([0.0, 1.0, 2.0, 3.0])
+
+
+def test_missed_ticks_are_skipped(loop, schedule):
+    control = Ticker(loop, 1, duration=2.5)
+    schedule.add(control)
+    loop.advance(0)
+    assert [handle.when for handle in loop.pending_timers] == [3.5]
+
+
+def test_unchanged_controls_do_not_notify(loop, schedule, changes):
+    control = Ticker(loop, 1, changes=False)
+    schedule.add(control)
+    loop.advance(1)
+    assert control.calls == [0.0, 1.0]
+    assert control.invalidated == 0
+    assert changes == []
+
+
+def test_aligned_controls_run_on_wall_clock_boundaries(loop, schedule, monkeypatch):
+    wall_clock = {'now': 100.25}
+    monkeypatch.setattr(scheduler.time, 'time', lambda: wall_clock['now'] + loop.time())
+    control = Ticker(loop, 1, align=True, duration=0.1)
+    schedule.add(control)
+    loop.advance(3)
+    assert control.calls == pytest.approx([0.75, 1.75, 2.75])
+
+
+def test_aligned_controls_run_early_in_a_batch_run_once_per_boundary(loop, schedule, monkeypatch):
+    monkeypatch.setattr(scheduler.time, 'time', lambda: 100.25 + loop.time())
+    aligned = Ticker(loop, 1, align=True)
+    schedule.add(aligned)
+    loop.advance(0.75 - RESOLUTION * 0.8)
+    # Runs right now, and takes the aligned control along because it is due within RESOLUTION
+    schedule.add(Ticker(loop, 10))
+    loop.advance(2.3)
+    assert aligned.calls == pytest.approx([0.75 - RESOLUTION * 0.8, 1.75, 2.75])
+
+
+def test_removed_controls_are_not_called(loop, schedule):
+    control = Ticker(loop, 1)
+    schedule.add(control)
+    loop.advance(1)
+    schedule.remove(control)
+    loop.advance(3)
+    assert control.calls == [0.0, 1.0]
+
+
+def test_controls_stop_themselves_by_clearing_their_interval(loop, schedule):
+    control = Ticker(loop, 1)
+    schedule.add(control)
+    loop.advance(1)
+    control.periodic_interval = None
+    loop.advance(3)
+    assert control.calls == [0.0, 1.0, 2.0]
+    assert loop.pending_timers == []
+
+
+def test_run_now_does_not_affect_the_schedule(loop, schedule, changes):
+    control = Ticker(loop, 1)
+    schedule.add(control)
+    loop.advance(0)
+    loop.now = 0.5
+    schedule.run_now(control)
+    loop.advance(0.5)
+    assert control.calls == [0.0, 0.5, 1.0]
+    assert changes == [0.0, 0.5, 1.0]
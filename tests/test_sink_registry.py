@@ -0,0 +1,59 @@
+from modules.audiooutput.registry import SinkRecord, SinkRegistry
+
+
+class SinkInfo:
+    def __init__(self, name, index, description=None, flags=0, **proplist):
+        self.name = name
+        self.index = index
+        self.description = description or name.upper()
+        self.flags = flags
+        self.proplist = proplist
+
+
+def test_first_update_adds_all_sinks():
+    registry = SinkRegistry()
+    diff = registry.update([SinkInfo('a', 0), SinkInfo('b', 1)])
+    assert [record.name for record in diff.added] == ['a', 'b']
+    assert diff.removed == diff.changed == []
+    assert len(registry) == 2
+    assert registry.by_name('b') == SinkRecord('b', 1, 'B', 0)
+    assert registry.by_index(0).name == 'a'
+
+
+def test_identical_updates_are_not_reported():
+    registry = SinkRegistry()
+    diffs = []
+    registry.add_listener(diffs.append)
+    registry.update([SinkInfo('a', 0)])
+    diff = registry.update([SinkInfo('a', 0, 'A', big='ignored')])
+    assert not diff
+    assert len(diffs) == 1
+
+
+def test_added_removed_and_changed_sinks_are_reported():
+    registry = SinkRegistry()
+    registry.update([SinkInfo('a', 0), SinkInfo('b', 1), SinkInfo('c', 2)])
+    diffs = []
+    registry.add_listener(diffs.append)
+    diff = registry.update([SinkInfo('a', 0), SinkInfo('c', 2, 'Renamed'), SinkInfo('d', 3)])
+    assert diffs == [diff]
+    assert diff.added == [SinkRecord('d', 3, 'D', 0)]
+    assert diff.removed == [SinkRecord('b', 1, 'B', 0)]
+    assert diff.changed == [SinkRecord('c', 2, 'Renamed', 0)]
+    assert [record.name for record in registry] == ['a', 'c', 'd']
+
+
+def test_sinks_that_reappear_with_a_new_index_are_changed():
+    registry = SinkRegistry()
+    registry.update([SinkInfo('a', 0)])
+    diff = registry.update([SinkInfo('a', 7)])
+    assert diff.added == diff.removed == []
+    assert diff.changed == [SinkRecord('a', 7, 'A', 0)]
+    assert registry.by_index(0) is None
+    assert registry.by_index(7).name == 'a'
+
+
+def test_records_only_keep_the_properties_that_are_used():
+    record = SinkRecord.from_sink_info(SinkInfo('a', 0, 'Speakers', 4, big='x' * 1000))
+    assert record == SinkRecord('a', 0, 'Speakers', 4)
+    assert not hasattr(record, 'proplist')
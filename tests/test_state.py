@@ -0,0 +1,112 @@
+import os
+import pickle
+import time
+
+import pytest
+
+from modules.state import StateJournal
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'state')
+
+
+def wait_for(predicate, timeout=5):
+    """
+    Waits for the writer thread of a journal that is not closed, like a daemon that is killed
+    """
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'Timed out waiting for the journal to be written'
+        time.sleep(0.01)
+
+
+def journal_records(path):
+    records = []
+    with open(path + '.journal', 'rb') as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                return records
+
+
+def test_nothing_saved_loads_an_empty_state(path):
+    assert StateJournal(path).load() == {}
+
+
+def test_state_survives_a_clean_exit(path):
+    journal = StateJournal(path)
+    journal.load()
+    journal.record({'A': {'state': True}, 'B': None})
+    journal.close({'A': {'state': False}, 'B': None})
+    assert StateJournal(path).load() == {'A': {'state': False}, 'B': None}
+
+
+def test_only_changed_modules_are_recorded(path):
+    journal = StateJournal(path)
+    journal.load()
+    journal.record({'A': 1, 'B': 1})
+    journal.record({'A': 1, 'B': 1})
+    journal.record({'A': 1, 'B': 2})
+    wait_for(lambda: os.path.exists(path + '.journal') and len(journal_records(path)) == 2)
+    assert journal_records(path) == [{'A': 1, 'B': 1}, {'B': 2}]
+
+
+def test_recorded_state_is_copied(path):
+    journal = StateJournal(path)
+    journal.load()
+    state = {'A': {'items': [1]}}
+    journal.record(state)
+    state['A']['items'].append(2)
+    journal.record(state)
+    journal.close(state)
+    assert StateJournal(path).load() == {'A': {'items': [1, 2]}}
+
+
+def test_state_survives_being_killed(path):
+    journal = StateJournal(path)
+    journal.load()
+    journal.record({'A': 1})
+    journal.record({'A': 2})
+    wait_for(lambda: os.path.exists(path + '.journal') and len(journal_records(path)) == 2)
+    assert StateJournal(path).load() == {'A': 2}
+
+
+@pytest.mark.parametrize('torn_length', [1, 2, -1])
+def test_torn_record_is_dropped_and_later_records_are_readable(path, torn_length):
+    torn = pickle.dumps({'A': 2, 'B': 1})
+    with open(path + '.journal', 'wb') as f:
+        f.write(pickle.dumps({'A': 1}))
+        f.write(torn[:torn_length % len(torn)])
+    journal = StateJournal(path)
+    assert journal.load() == {'A': 1}
+    assert os.path.getsize(path + '.journal') == len(pickle.dumps({'A': 1}))
+    journal.record({'A': 3})
+    wait_for(lambda: len(journal_records(path)) == 2)
+    assert StateJournal(path).load() == {'A': 3}
+
+
+def test_journal_is_compacted_into_the_checkpoint(path):
+    journal = StateJournal(path, compact_after=3)
+    journal.load()
+    for value in range(3):
+        journal.record({'A': value, 'B': 'kept'})
+    journal.record({'A': 3, 'B': 'kept'})
+    wait_for(lambda: os.path.exists(path) and journal_records(path) == [{'A': 3}])
+    with open(path, 'rb') as f:
+        assert pickle.load(f) == {'A': 2, 'B': 'kept'}
+    assert StateJournal(path).load() == {'A': 3, 'B': 'kept'}
+
+
+def test_long_journal_is_compacted_on_load(path):
+    with open(path + '.journal', 'wb') as f:
+        for value in range(4):
+            f.write(pickle.dumps({'A': value}))
+    journal = StateJournal(path, compact_after=3)
+    assert journal.load() == {'A': 3}
+    journal.close({'A': 3})
+    assert journal_records(path) == []
+    with open(path, 'rb') as f:
+        assert pickle.load(f) == {'A': 3}
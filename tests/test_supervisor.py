@@ -0,0 +1,71 @@
+import subprocess
+import sys
+
+import pytest
+
+from modules.eventloop import EventLoop
+from modules.supervisor import ProcessSupervisor
+
+
+@pytest.fixture
+def event_loop():
+    loop = EventLoop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def supervisor(event_loop):
+    supervisor = ProcessSupervisor(event_loop)
+    yield supervisor
+    supervisor.close()
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+def run_until(loop, predicate, timeout=5):
+    # The timer only wakes the loop up when the expected exits never happen
+    deadline = loop.time() + timeout
+    wakeup = loop.call_at(deadline, lambda: None)
+    while not predicate() and loop.time() < deadline:
+        loop.run_once()
+    wakeup.cancel()
+    assert predicate()
+
+
+def test_exit_callbacks_run_on_sigchld(event_loop, supervisor):
+    exited = []
+    supervisor.spawn(python('import sys; sys.exit(3)'), on_exit=exited.append)
+    run_until(event_loop, lambda: exited)
+    assert exited[0].returncode == 3
+
+
+def test_several_exits_are_reported(event_loop, supervisor):
+    exited = []
+    for code in range(3):
+        supervisor.spawn(python('import sys; sys.exit(%d)' % code), on_exit=exited.append)
+    run_until(event_loop, lambda: len(exited) == 3)
+    assert sorted(process.returncode for process in exited) == [0, 1, 2]
+
+
+def test_failing_exit_callbacks_do_not_stop_other_callbacks(event_loop, supervisor):
+    exited = []
+
+    def fail(process):
+        raise RuntimeError('callback failed')
+
+    supervisor.spawn(python('pass'), on_exit=fail)
+    supervisor.spawn(python('pass'), on_exit=exited.append)
+    run_until(event_loop, lambda: exited)
+
+
+def test_unsupervised_children_are_not_reaped(event_loop, supervisor):
+    exited = []
+    unsupervised = subprocess.Popen(python('pass'))
+    supervisor.spawn(python('import time; time.sleep(0.1)'), on_exit=exited.append)
+    run_until(event_loop, lambda: exited)
+    # Only the owner of the Popen object collects its exit status
+    assert unsupervised.returncode is None
+    assert unsupervised.wait(5) == 0
@@ -0,0 +1,52 @@
+import socket
+
+import pytest
+
+from modules.eventloop import EventLoop
+from modules.transport import CommandSocketServer
+
+
+@pytest.fixture
+def event_loop():
+    loop = EventLoop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'commands')
+
+
+def ignore(commands, reply):
+    reply([False] * len(commands))
+
+
+def test_stale_socket_is_replaced(event_loop, path):
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    server = CommandSocketServer(event_loop, path, ignore)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    client.close()
+    server.close()
+
+
+def test_socket_in_use_is_not_taken_over(event_loop, path):
+    server = CommandSocketServer(event_loop, path, ignore)
+    with pytest.raises(ValueError, match='in use'):
+        CommandSocketServer(event_loop, path, ignore)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    client.close()
+    server.close()
+
+
+def test_other_files_are_not_removed(event_loop, path):
+    with open(path, 'w') as f:
+        f.write('keep')
+    with pytest.raises(ValueError, match='not a socket'):
+        CommandSocketServer(event_loop, path, ignore)
+    with open(path) as f:
+        assert f.read() == 'keep'